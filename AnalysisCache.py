@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+# %% LRU 缓存
+class MatrixCache(object):
+    """
+    LRU cache of derived analysis matrices keyed by (kind, configuration)
+    Cached arrays are read-only because they are shared by every caller (and every thread).
+    :param maxsize: number of entries kept, the least recently used one is evicted first
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, builder, *key):
+        k = (builder.__name__,) + key
+        with self.lock:
+            if k in self.entries:
+                self.entries.move_to_end(k)
+                self.hits += 1
+                return self.entries[k]
+        value = builder(*key)  # Built outside the lock, a concurrent duplicate build is harmless
+        for v in value if isinstance(value, tuple) else (value,):
+            v.flags.writeable = False
+        with self.lock:
+            self.misses += 1
+            self.entries[k] = value
+            self.entries.move_to_end(k)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    def snapshot(self):
+        # Plain dict of all entries, picklable, to ship precomputed matrices to worker processes
+        with self.lock:
+            return dict(self.entries)
+
+    def install(self, entries):
+        # Entries built elsewhere (unpickled in a worker), made read-only like the ones built here
+        for value in entries.values():
+            for v in value if isinstance(value, tuple) else (value,):
+                v.flags.writeable = False
+        with self.lock:
+            self.entries.update(entries)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_cache = MatrixCache()
+
+
+def snapshot():
+    return _cache.snapshot()
+
+
+def install(entries):
+    _cache.install(entries)
+
+
+# %% 构造函数
+def _hanning(frame_len):
+    return np.hanning(frame_len)
+
+
+def _melFilterbank(fs, nfft, n_mels):
+    mel = lambda f: 1127 * np.log(1 + f / 700)
+    mhi = mel(fs / 2)
+    cf = mhi / (n_mels + 1) * np.arange(1, n_mels + 2)  # Channel centres, cf[n_mels] is the upper edge
+    k = np.arange(1, nfft // 2 + 1)
+    m = mel(k * fs / nfft)
+    chan = np.searchsorted(cf, m)
+    lo = np.where(chan > 0, cf[np.maximum(chan - 1, 0)], 0)
+    lo_wt = (cf[np.minimum(chan, n_mels)] - m) / (cf[np.minimum(chan, n_mels)] - lo)  # Share of the lower channel
+    fb = np.zeros([n_mels + 1, nfft // 2 + 1])
+    fb[chan - 1, k] += lo_wt * (chan > 0)
+    fb[np.minimum(chan, n_mels), k] += (1 - lo_wt) * (chan < n_mels)
+    return fb[:n_mels]
+
+
+def _dctMatrix(n_mels, order):
+    j = np.arange(1, order + 1)[:, None]
+    k = np.arange(1, n_mels + 1)[None, :]
+    return np.sqrt(2 / n_mels) * np.cos(np.pi * j / n_mels * (k - 0.5))
+
+
+def _lifter(order, cepslift):
+    return 1 + cepslift / 2 * np.sin(np.pi * np.arange(1, order + 1) / cepslift)
+
+
+def _warpBasis(nfft, order, alpha):
+    w = 2 * np.pi * np.arange(nfft // 2 + 1) / nfft
+    beta = w + 2 * np.arctan(alpha * np.sin(w) / (1 - alpha * np.cos(w)))
+    wt = np.full(len(w), 2.)
+    wt[0] = 1
+    if nfft % 2 == 0:
+        wt[-1] = 1
+    wt = wt / nfft
+    C = np.cos(np.outer(beta, np.arange(2 * order + 1)))
+    Phi = C[:, :order + 1]
+    init = np.linalg.solve((Phi * wt[:, None]).T @ Phi, (Phi * wt[:, None]).T) / 2  # Least-squares fit operator
+    return C, wt, init
+
+
+def _librosaMel(fs, n_fft, n_mels):
+    import librosa
+    return librosa.filters.mel(sr=fs, n_fft=n_fft, n_mels=n_mels)
+
+
+def _cast(builder):
+    # Builder of the same matrices rounded to another precision; always built from the float64 ones
+    def build(dtype, *key):
+        value = _cache.get(builder, *key)
+        if isinstance(value, tuple):
+            return tuple(v.astype(dtype) for v in value)
+        return value.astype(dtype)
+    build.__name__ = builder.__name__ + '_as'
+    return build
+
+
+def _entry(builder, dtype, *key):
+    # (cache key, value); float64 entries keep their original keys, other precisions are separate entries derived
+    # from them
+    dtype = np.dtype(dtype).name
+    if dtype == 'float64':
+        return (builder.__name__,) + key, _cache.get(builder, *key)
+    cast = _CASTS[builder]
+    return (cast.__name__, dtype) + key, _cache.get(cast, dtype, *key)
+
+
+def _get(builder, dtype, *key):
+    return _entry(builder, dtype, *key)[1]
+
+
+# %% 接口
+def window(frame_len, dtype='float64'):
+    # np.hanning(frame_len)
+    return _get(_hanning, dtype, frame_len)
+
+
+def melFilterbank(fs, nfft, n_mels, dtype='float64'):
+    """
+    HTK-style triangular mel filterbank (the one of SPTK / pysptk mfcc), mel(f) = 1127 ln(1 + f / 700)
+    :return (n_mels, nfft // 2 + 1) weights on the rfft bins; the DC bin is not used
+    """
+    return _get(_melFilterbank, dtype, fs, nfft, n_mels)
+
+
+def dctMatrix(n_mels, order, dtype='float64'):
+    # DCT-II rows 1..order of HTK / SPTK: sqrt(2 / n) cos(pi j / n (k - 0.5))
+    return _get(_dctMatrix, dtype, n_mels, order)
+
+
+def lifter(order, cepslift, dtype='float64'):
+    return _get(_lifter, dtype, order, cepslift)
+
+
+def warpBasis(nfft, order, alpha, dtype='float64'):
+    """
+    cos(j beta(w)) on the rfft bins for j = 0 .. 2 * order, beta the all-pass warped frequency, the trapezoid weights
+    that turn a sum over the bins into the mean over the unit circle, and the least-squares operator of the initial
+    mel-cepstrum
+    """
+    return _get(_warpBasis, dtype, nfft, order, alpha)
+
+
+_CASTS = {builder: _cast(builder) for builder in (_hanning, _melFilterbank, _dctMatrix, _lifter, _warpBasis)}
+
+
+def librosaMel(fs, n_fft, n_mels):
+    # librosa.filters.mel, which librosa.feature.melspectrogram / mfcc rebuild on every call
+    return _cache.get(_librosaMel, fs, n_fft, n_mels)
+
+
+def precompute(fs=16000, frame_len=512, order=20, n_mels=None, alpha=0.35, cepslift=22, dtype='float64'):
+    """
+    Build every matrix of one analysis configuration and return them to ship to workers
+    :param dtype: precision of the analysis, float32 matrices are rounded from the float64 ones
+    :return dict for install(), holding only the entries of this configuration
+    """
+    n_mels = order * 2 if n_mels is None else n_mels
+    return dict([_entry(_hanning, dtype, frame_len),
+                 _entry(_melFilterbank, dtype, fs, frame_len, n_mels),
+                 _entry(_dctMatrix, dtype, n_mels, order),
+                 _entry(_lifter, dtype, order, cepslift),
+                 _entry(_warpBasis, dtype, frame_len, order, alpha)])
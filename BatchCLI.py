@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import glob
+import struct
+import argparse
+import numpy as np
+from Framing import frameCount, frameView, windowFrames
+from WaveIO import WaveFile, loadWave
+from Extractor import extract, getPool, FEATURES
+import AnalysisCache
+
+AUDIO_EXT = ('.wav', '.flac', '.ogg', '.mp3', '.aiff', '.aif')
+
+
+# %% 输入文件
+def findFiles(paths):
+    """
+    Audio files of the given paths: directories are walked recursively, '@list.txt' reads one path per line
+    Files of a directory are named relative to it, files given directly or listed relative to their common parent
+    directory, so a/x.wav and b/x.wav become a/x and b/x. Two files that would still share a name are rejected.
+    :return sorted list of (path, name relative to its root)
+    """
+    files, loose = [], []
+    for path in paths:
+        if path.startswith('@'):
+            with open(path[1:]) as f:
+                loose += [p for p in (s.strip() for s in f) if p]
+        elif os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in names:
+                    if name.lower().endswith(AUDIO_EXT):
+                        p = os.path.join(root, name)
+                        files.append((p, os.path.splitext(os.path.relpath(p, path))[0]))
+        else:
+            loose.append(path)
+    if loose:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in loose])
+        files += [(p, os.path.splitext(os.path.relpath(os.path.abspath(p), root))[0]) for p in loose]
+    files = sorted(set(files))
+    source = {}
+    for p, name in files:
+        if source.setdefault(name, p) != p:
+            raise ValueError('%s and %s would both be stored as %r, pass their common parent directory instead.'
+                             % (source[name], p, name))
+    return files
+
+
+def fileInfo(filename):
+    # (samples, fs, channels, seekable) from the header when possible, the whole file is decoded only for compressed
+    # formats
+    try:
+        wav = WaveFile(filename)
+        return len(wav), wav.fs, wav.channels, True
+    except (ValueError, struct.error):
+        wav, fs = loadWave(filename)
+        return wav.shape[-1], fs, wav.shape[0] if wav.ndim > 1 else 1, False
+
+
+def readRange(filename, start, stop, frame_len, hop, dtype='float64'):
+    """
+    Samples of frames [start, stop) in the readWave layout (zero-padded up to a multiple of hop)
+    Only the needed part of a WAV file is read, so a range costs the same wherever it lies in the file.
+    :param dtype: 'float32' or 'float64'
+    :return 1-D array, or (channels, samples) for multichannel files
+    """
+    begin, end = start * hop, (stop - 1) * hop + frame_len
+    try:
+        wav = WaveFile(filename)
+        x = wav.read(begin, min(end, len(wav)), dtype)
+    except (ValueError, struct.error):
+        x = loadWave(filename, dtype)[0]
+        x = x[..., begin:end]
+    out = np.zeros(x.shape[:-1] + (end - begin,), dtype=dtype)
+    out[..., :x.shape[-1]] = x
+    return out
+
+
+# %% 任务
+def makeTasks(files, frame_len, hop, split):
+    """
+    One task per file, or per range of at most split frames for long WAV files, largest first so workers stay
+    balanced. Compressed files are never split: every range of them would decode the whole file again.
+    :return tasks (filename, name, start, stop) and dict name -> (frames, fs, channels)
+    """
+    tasks, info = [], {}
+    for filename, name in files:
+        length, fs, channels, seekable = fileInfo(filename)
+        frame = frameCount(-(-length // hop) * hop, frame_len, hop)  # padWave pads to a multiple of hop
+        info[name] = (frame, fs, channels)
+        step = split if seekable else max(frame, 1)
+        tasks += [(filename, name, s, min(s + step, frame)) for s in range(0, frame, step)]
+    tasks.sort(key=lambda t: t[2] - t[3])
+    return tasks, info
+
+
+def partPath(out_dir, name, feature, start, stop):
+    return os.path.join(out_dir, name, '%s.%d-%d.part.npy' % (feature, start, stop))
+
+
+def _resetParts(out_dir, name, state):
+    """
+    Keep the part files of an interrupted run only if they were computed from the same file with the same ranges
+    <name>/parts.json records the source stamp (size, mtime) and the frame ranges of the parts; when either differs,
+    every <name>/*.part.npy is deleted before the file is scheduled again.
+    :param state: dict(stamp=[size, mtime_ns], bounds=[[start, stop], ...]) of this run
+    """
+    path = os.path.join(out_dir, name, 'parts.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            if json.load(f) == state:
+                return
+    for p in glob.glob(os.path.join(glob.escape(os.path.join(out_dir, name)), '*.part.npy')):
+        os.remove(p)
+    with open(path, 'w') as f:
+        json.dump(state, f)
+
+
+def _runTask(task):
+    # Analyze one frame range and write one part file per feature
+    filename, name, start, stop, frame_len, hop, order, features, out_dir, dtype = task
+    tic = time.perf_counter()
+    wav = readRange(filename, start, stop, frame_len, hop, dtype)
+    frames = windowFrames(frameView(wav, frame_len, hop)[..., :stop - start, :],
+                          AnalysisCache.window(frame_len, dtype))  # (channels, frame, frame_len) for multichannel
+    for feature in features:
+        path = partPath(out_dir, name, feature, start, stop)
+        if os.path.exists(path):
+            continue
+        tmp = path[:-len('.part.npy')] + '.tmp.npy'
+        np.save(tmp, extract(frames, feature, order=order))
+        os.replace(tmp, path)  # A part exists only once it is complete, interrupted tasks are simply rerun
+    return name, stop - start, time.perf_counter() - tic
+
+
+def assemble(out_dir, name, features, order, bounds, dtype='float64', channels=1):
+    # Concatenate the parts of a finished file into <name>/<feature>.npy along the frame axis and drop them
+    for feature in features:
+        parts = [partPath(out_dir, name, feature, s, e) for s, e in bounds]
+        shape = ([channels] if channels > 1 else []) + [0, FEATURES[feature][1](order)]
+        data = np.concatenate([np.load(p) for p in parts], axis=-2) if parts else np.empty(shape, dtype=dtype)
+        np.save(os.path.join(out_dir, name, feature + '.npy'), data)
+        for p in parts:
+            os.remove(p)
+    if os.path.exists(os.path.join(out_dir, name, 'parts.json')):
+        os.remove(os.path.join(out_dir, name, 'parts.json'))
+
+
+# %% 批处理
+def run(paths, out_dir, features=('lpc',), frame_len=512, order=20, processes=None, split=2048, dtype='float64',
+        log=sys.stderr):
+    """
+    Analyze a corpus on the persistent process pool, resuming from out_dir/manifest.json and the part files
+    Output: out_dir/<name>/<feature>.npy, one (frame, width) matrix per file and feature, (channels, frame, width)
+    for multichannel files (every channel is analyzed, see Extractor.extract).
+    :param paths: files, directories or '@list' files
+    :param features: keys of Extractor.FEATURES
+    :param processes: pool size, default the number of cores
+    :param split: maximum frames per task
+    :param dtype: analysis precision, 'float64' or 'float32' (see Precision.py for its accuracy)
+    :return manifest dict
+    """
+    unknown = [f for f in features if f not in FEATURES]
+    if unknown:
+        raise ValueError('Unknown feature %r, expected one of %s.' % (unknown[0], ', '.join(FEATURES)))
+    hop = int(frame_len / 2)
+    params = dict(features=list(features), frame_len=frame_len, hop=hop, order=order)
+    if dtype != 'float64':  # Manifests written before the precision option stay valid
+        params['dtype'] = dtype
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    manifest = dict(params=params, files={})
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest['params'] != params:
+            raise ValueError('%s was written with %s, use another output directory for %s.'
+                             % (out_dir, manifest['params'], params))
+
+    def stamp(filename):
+        st = os.stat(filename)
+        return [st.st_size, st.st_mtime_ns]
+
+    files = [(p, n) for p, n in findFiles(paths)
+             if n not in manifest['files'] or manifest['files'][n]['stamp'] != stamp(p)]
+    tasks, info = makeTasks(files, frame_len, hop, split)
+    bounds = {}
+    for t in tasks:
+        bounds.setdefault(t[1], []).append(list(t[2:4]))
+    for p, name in files:
+        os.makedirs(os.path.join(out_dir, name), exist_ok=True)
+        _resetParts(out_dir, name, dict(stamp=stamp(p), bounds=sorted(bounds.get(name, []))))
+    remaining = {name: len(b) for name, b in bounds.items()}
+    total = sum(t[3] - t[2] for t in tasks)
+    print('%d files (%d up to date), %d tasks, %d frames' % (len(files), len(manifest['files']), len(tasks), total),
+          file=log)
+
+    def finish(filename, name):
+        frame, fs, channels = info[name]
+        assemble(out_dir, name, features, order, sorted(bounds.get(name, [])), dtype, channels)
+        manifest['files'][name] = dict(file=filename, stamp=stamp(filename), frames=frame, fs=fs, channels=channels)
+        tmp = manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp, manifest_path)
+
+    source = dict((n, p) for p, n in files)
+    for name in source:
+        if name not in remaining:  # Shorter than one frame
+            finish(source[name], name)
+    done, busy, tic = 0, 0., time.perf_counter()
+    args = (frame_len, hop, order, list(features), out_dir, dtype)
+    for name, n, seconds in getPool(processes).imap_unordered(_runTask, [t + args for t in tasks]):
+        done += n
+        busy += seconds
+        remaining[name] -= 1
+        if remaining[name] == 0:
+            finish(source[name], name)
+        elapsed = time.perf_counter() - tic
+        print('\r%5.1f%%  %d / %d frames  %.0f frames/s  %d files done' % (
+            100 * done / max(total, 1), done, total, done / elapsed, len(manifest['files'])), end='', file=log)
+    if tasks:
+        elapsed = time.perf_counter() - tic
+        print('\n%.2f s, %.0f frames/s, worker utilization %.0f%%' % (
+            elapsed, total / elapsed, 100 * busy / (elapsed * getPool(processes)._processes)), file=log)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='LPC / MCEP / MFCC of a whole corpus on all cores')
+    parser.add_argument('paths', nargs='+', help='audio files, directories, or @list files with one path per line')
+    parser.add_argument('-o', '--output', default='features')
+    parser.add_argument('--features', default='lpc', help='comma separated, among %s' % ', '.join(FEATURES))
+    parser.add_argument('--frame-len', type=int, default=512)
+    parser.add_argument('--order', type=int, default=20)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--split', type=int, default=2048, help='maximum frames per task')
+    parser.add_argument('--dtype', default='float64', choices=('float64', 'float32'))
+    args = parser.parse_args()
+    run(args.paths, args.output, args.features.split(','), args.frame_len, args.order, args.processes, args.split,
+        args.dtype)
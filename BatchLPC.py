@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import Profiler
+
+
+# %% 自相关
+def autocorrelation(wav_frame, order):
+    """
+    Biased autocorrelation of every frame, computed with one batched FFT
+    :param wav_frame: windowed frames, shape (frame, frame_len) or (channels, frame, frame_len)
+    :param order: highest lag to return
+    :return autocorrelation matrix, shape (frame, order + 1) or (channels, frame, order + 1)
+    """
+    wav_frame = np.atleast_2d(wav_frame)
+    frame_len = wav_frame.shape[-1]
+    nfft = 1 << int(np.ceil(np.log2(frame_len + order)))  # No circular aliasing for the first order+1 lags
+    spec = np.fft.rfft(wav_frame, nfft, axis=-1)
+    power = spec.real ** 2 + spec.imag ** 2
+    r = np.fft.irfft(power, nfft, axis=-1)[..., :order + 1]
+    return r.astype(wav_frame.dtype, copy=False) if wav_frame.dtype == np.float32 else r  # numpy < 2 upcasts
+
+
+# %% Levinson-Durbin
+def levinson(r, order):
+    """
+    Levinson-Durbin recursion vectorized across frames
+    :param r: autocorrelation matrix, shape (frame, order + 1) at least; leading axes, e.g. (channels, frame, ...),
+              are flattened into one batch and restored in the outputs
+    :param order: prediction order
+    :return (lpc, refl, err): lpc is (frame, order + 1) with lpc[:, 0] = 1, refl is the (frame, order) reflection
+            coefficients and err is the (frame,) final prediction error. Silent frames (r[0] == 0) give the identity
+            predictor [1, 0, ..., 0] with zero reflection coefficients and zero error. Computed in the precision of r
+            (float32 or float64).
+    """
+    r = np.atleast_2d(r)
+    if r.ndim > 2:
+        lpc, refl, err = levinson(r.reshape(-1, r.shape[-1]), order)
+        shape = r.shape[:-1]
+        return lpc.reshape(shape + (order + 1,)), refl.reshape(shape + (order,)), err.reshape(shape)
+    frame = r.shape[0]
+    dtype = np.float32 if r.dtype == np.float32 else np.float64
+    lpc = np.zeros([frame, order + 1], dtype=dtype)
+    lpc[:, 0] = 1
+    refl = np.zeros([frame, order], dtype=dtype)
+    err = r[:, 0].astype(dtype)
+    for i in range(1, order + 1):
+        acc = r[:, i] + np.einsum('ij,ij->i', lpc[:, 1:i], r[:, i - 1:0:-1])
+        valid = err > 0
+        k = np.zeros(frame, dtype=dtype)
+        np.divide(-acc, err, out=k, where=valid)
+        lpc[:, 1:i] += k[:, None] * lpc[:, i - 1:0:-1]
+        lpc[:, i] = k
+        refl[:, i - 1] = k
+        err *= 1 - k * k
+    return lpc, refl, err
+
+
+def unstable(lpc, refl, err):
+    """
+    Frames whose recursion broke down in reduced precision: non-finite coefficients, a reflection coefficient with
+    |k| >= 1 (the predictor is no longer minimum phase) or a negative prediction error
+    :return boolean mask of the leading shape of lpc
+    """
+    with np.errstate(invalid='ignore'):
+        return ~np.isfinite(lpc).all(axis=-1) | (np.abs(refl) >= 1).any(axis=-1) | ~(err >= 0)
+
+
+def conditionNumber(lpc):
+    """
+    Estimate of the condition number of each frame's autocorrelation matrix: the dynamic range max / min of the model
+    power spectrum 1 / |A|^2, which the Toeplitz eigenvalues are bounded by
+    :return array of the leading shape of lpc
+    """
+    nfft = 1 << int(np.ceil(np.log2(4 * lpc.shape[-1])))
+    spec = np.fft.rfft(lpc, nfft, axis=-1)
+    power = spec.real ** 2 + spec.imag ** 2
+    return power.max(axis=-1) / np.maximum(power.min(axis=-1), np.finfo(power.dtype).tiny)
+
+
+def checkedLevinson(r, order, exact, max_cond=None):
+    """
+    levinson() in the precision of r; in float32, frames that are unstable() or whose condition number exceeds
+    max_cond are redone in float64
+    Rounding r to float32 perturbs it by about eps32 = 1.2e-7, which a condition number above 1 / eps32 can turn into
+    an error of the order of the coefficients themselves, whatever the precision of the recursion.
+    :param r: autocorrelation matrix, float32 or float64
+    :param order: prediction order
+    :param exact: function(mask) -> float64 autocorrelation of the masked frames
+    :param max_cond: condition number limit, default 1 / eps of the precision of r
+    :return (lpc, refl, err) in the precision of r; the number of redone frames is counted by the
+            'lpc_fallback' profiler stage
+    """
+    lpc, refl, err = levinson(r, order)
+    if lpc.dtype == np.float64:
+        return lpc, refl, err
+    max_cond = 1 / np.finfo(lpc.dtype).eps if max_cond is None else max_cond
+    bad = unstable(lpc, refl, err)
+    bad[~bad] = conditionNumber(lpc[~bad]) > max_cond
+    if bad.any():
+        with Profiler.stage('lpc_fallback', int(bad.sum())):
+            lpc[bad], refl[bad], err[bad] = levinson(exact(bad), order)
+    return lpc, refl, err
+
+
+def batchLPC(wav_frame, order, max_cond=None):
+    """
+    LPC analysis of the whole windowed frame matrix in one call (autocorrelation method)
+    float32 frames are analyzed in float32, with a per-frame float64 fallback, see checkedLevinson().
+    :param wav_frame: windowed frames, shape (frame, frame_len)
+    :param order: prediction order
+    :param max_cond: condition number limit of the float32 path
+    :return (lpc, refl, err), see levinson()
+    """
+    return checkedLevinson(autocorrelation(wav_frame, order), order,
+                           lambda bad: autocorrelation(np.asarray(wav_frame)[bad].astype(np.float64), order), max_cond)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import numpy as np
+from Framing import padWave
+from WaveIO import loadWave
+from Extractor import extractWave, closePool, BACKENDS
+import Profiler
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# %% 输入信号
+def loadSignal(filename, tile=1):
+    """
+    Mono test signal: the first channel of the file, tiled to synthesize longer inputs
+    :param filename: audio file
+    :param tile: number of repetitions
+    :return (signal, sampling rate)
+    """
+    wav, fs = loadWave(filename)
+    if wav.ndim > 1:
+        wav = wav[0]
+    return np.tile(wav, tile), fs
+
+
+def peakRSS():
+    # Peak resident set size (MB) of this process and of its largest child, among the children that have exited
+    if resource is None:
+        return None, None
+    scale = 1 / 1024 ** 2 if sys.platform == 'darwin' else 1 / 1024  # ru_maxrss is bytes on macOS, KB elsewhere
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+# %% 单次测试 (在独立进程中运行, 以便测量峰值内存)
+def runCase(case):
+    """
+    Time one configuration: one warm-up call (pool start-up) then the best of case['repeat'] calls
+    :param case: dict with file, tile, frame_len, order, feature, backend, workers, repeat and optionally profile
+    :return case extended with frames, seconds, frames_per_sec and peak RSS; with case['profile'], one more call is
+            instrumented after the timed ones and its Profiler.records() are added as 'stages'
+    """
+    wav, fs = loadSignal(case['file'], case['tile'])
+    wav, frame = padWave(wav, case['frame_len'])
+    args = (wav, frame, case['frame_len'], case['feature'], case['backend'], case['workers'], case['order'])
+    extractWave(*args)
+    best = np.inf
+    for _ in range(case['repeat']):
+        tic = time.perf_counter()
+        extractWave(*args)
+        best = min(best, time.perf_counter() - tic)
+    closePool()  # RUSAGE_CHILDREN only counts reaped children, the persistent pool's workers must exit first
+    rss, child_rss = peakRSS()
+    result = dict(case, samples=len(wav), fs=fs, frames=frame, seconds=best, frames_per_sec=frame / best,
+                  peak_rss_mb=rss, peak_child_rss_mb=child_rss)
+    if case.get('profile'):
+        with Profiler.profile() as p:
+            wav, fs = loadSignal(case['file'], case['tile'])
+            wav, frame = padWave(wav, case['frame_len'])
+            extractWave(wav, *args[1:])
+        result['stages'] = p.records()
+    return result
+
+
+def runIsolated(case):
+    # A fresh interpreter per case keeps the peak RSS of one case from leaking into the next
+    out = subprocess.run([sys.executable, __file__, '--case', json.dumps(case)], check=True, capture_output=True,
+                         text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+# %% 一致性检查
+def checkAgreement(filename, tile, frame_len, order, feature, backends, workers, rtol=1e-10, atol=1e-12):
+    """
+    Run every backend once and compare it with the serial result before anything is timed
+    :return dict backend -> maximum absolute difference from serial
+    :raise AssertionError: if any backend disagrees
+    """
+    wav, _ = loadSignal(filename, tile)
+    wav, frame = padWave(wav, frame_len)
+    ref = extractWave(wav, frame, frame_len, feature, 'serial', order=order)
+    diff = {}
+    for backend in backends:
+        out = extractWave(wav, frame, frame_len, feature, backend, max(workers), order)
+        diff[backend] = float(np.max(np.abs(out - ref))) if ref.size else 0.
+        if not np.allclose(out, ref, rtol=rtol, atol=atol):
+            raise AssertionError('%s backend disagrees with serial for %s (frame_len=%d, order=%d, %s): %g'
+                                 % (backend, filename, frame_len, order, feature, diff[backend]))
+    return diff
+
+
+# %% 参数扫描
+def sweep(files, tiles, frame_lens, orders, workers, backends, features, repeat, profile=False):
+    records = []
+    for filename in files:
+        for tile in tiles:
+            for frame_len in frame_lens:
+                for order in orders:
+                    for feature in features:
+                        diff = checkAgreement(filename, tile, frame_len, order, feature, backends, workers)
+                        base = None
+                        for backend in backends:
+                            for n in ([1] if backend == 'serial' else workers):
+                                case = dict(file=filename, tile=tile, frame_len=frame_len, order=order,
+                                            feature=feature, backend=backend, workers=n, repeat=repeat,
+                                            profile=profile)
+                                r = runIsolated(case)
+                                r['max_abs_diff'] = diff[backend]
+                                base = r['seconds'] if backend == 'serial' else base
+                                r['speedup'] = base / r['seconds'] if base else None
+                                records.append(r)
+                                print('%-14s x%-3d N=%-5d p=%-3d %-5s %-8s w=%-3d %10.0f frames/s  x%.2f'
+                                      % (filename, tile, frame_len, order, feature, backend, n,
+                                         r['frames_per_sec'], r['speedup'] or 0), file=sys.stderr)
+    return records
+
+
+# %% 启动时间
+CORE = 'Extractor,SimpleLPC,ThreadBasedLPC,ProcessBasedLPC,CmpMCEP2MFCC,Streaming,SOSFilter,BatchCLI'
+HEAVY = ('librosa', 'numba', 'scipy', 'matplotlib', 'pysptk', 'audiolazy', 'soundfile')
+
+
+def startupTime(module, repeat=5):
+    """
+    Import time of one module in fresh interpreters (what every spawned worker pays), and the heavy packages it loads
+    :param module: module name, e.g. 'Extractor'
+    :param repeat: number of interpreters, the best time is kept
+    :return dict with module, seconds (import of the module alone, numpy included), interpreter (whole process
+            start-up including the import) and heavy (HEAVY packages found in sys.modules afterwards)
+    """
+    code = ('import sys, time, json; tic = time.perf_counter(); import %s; toc = time.perf_counter(); '
+            'print(json.dumps([toc - tic, [m for m in %r if m in sys.modules]]))' % (module, HEAVY))
+    best = dict(module=module, seconds=np.inf, interpreter=np.inf)
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+        interpreter = time.perf_counter() - tic
+        seconds, heavy = json.loads(out.stdout.strip().splitlines()[-1])
+        best.update(seconds=min(best['seconds'], seconds), interpreter=min(best['interpreter'], interpreter),
+                    heavy=heavy)
+    return best
+
+
+def startup(modules, repeat=5):
+    records = []
+    for module in modules:
+        r = startupTime(module, repeat)
+        records.append(r)
+        print('%-16s import %8.1f ms  interpreter %8.1f ms  %s' % (module, 1000 * r['seconds'],
+                                                                 1000 * r['interpreter'],
+                                                                 ', '.join(r['heavy']) or '-'), file=sys.stderr)
+    return records
+
+
+def _intList(s):
+    return [int(v) for v in s.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the LPC / MCEP / MFCC backends')
+    parser.add_argument('--files', default='hvd_001_5.wav,es01.wav')
+    parser.add_argument('--tile', type=_intList, default=[1, 4], help='synthetic lengths, as repetitions of a file')
+    parser.add_argument('--frame-len', type=_intList, default=[256, 512, 1024])
+    parser.add_argument('--order', type=_intList, default=[12, 20, 40])
+    parser.add_argument('--workers', type=_intList, default=[1, 2, 4])
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--features', default='lpc')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--profile', action='store_true', help='add per-stage timings of one instrumented call')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--startup', nargs='?', const=CORE, default=None, metavar='MODULES',
+                        help='measure the import time of these modules instead of the backends')
+    parser.add_argument('--case', help=argparse.SUPPRESS)  # Internal: run one case and print it as JSON
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(runCase(json.loads(args.case))))
+        sys.exit(0)
+    if args.startup:
+        records = startup(args.startup.split(','), args.repeat)
+    else:
+        records = sweep(args.files.split(','), args.tile, args.frame_len, args.order, args.workers,
+                        args.backends.split(','), args.features.split(','), args.repeat, args.profile)
+    report = dict(host=platform.node(), machine=platform.machine(), python=platform.python_version(),
+                  numpy=np.__version__, time=time.strftime('%Y-%m-%d %H:%M:%S'), results=records)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('%d results written to %s' % (len(records), args.output), file=sys.stderr)
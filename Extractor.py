@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+from BatchLPC import batchLPC
+from Framing import frameView, windowFrames
+import AnalysisCache
+import Profiler
+
+
+# %% 特征核函数
+# Every kernel maps a (n, frame_len) block of windowed frames to an (n, width) block of features.
+def lpcKernel(wav_frame, order):
+    return batchLPC(wav_frame, order)[0]
+
+
+def sptkLPCKernel(wav_frame, order):
+    import pysptk.sptk as sp
+    wav_frame = np.asarray(wav_frame, dtype=np.float64)  # pysptk only takes double
+    out = np.empty([len(wav_frame), order + 1])
+    for i in range(len(wav_frame)):
+        out[i, :] = sp.lpc(wav_frame[i, :], order)
+    return out
+
+
+def mcepKernel(wav_frame, order):
+    import pysptk.sptk as sp
+    wav_frame = np.asarray(wav_frame, dtype=np.float64)  # pysptk only takes double
+    out = np.empty([len(wav_frame), order + 1])
+    for i in range(len(wav_frame)):
+        out[i, :] = sp.mcep(wav_frame[i, :], order)
+    return out
+
+
+def mfccKernel(wav_frame, order):
+    import pysptk.sptk as sp
+    wav_frame = np.asarray(wav_frame, dtype=np.float64)  # pysptk only takes double
+    out = np.empty([len(wav_frame), order])
+    for i in range(len(wav_frame)):
+        out[i, :] = sp.mfcc(wav_frame[i, :], order, num_filterbanks=order * 2, alpha=0.97, eps=1, cepslift=22)
+    return out
+
+
+def fusedMCEPKernel(wav_frame, order):
+    from FeaturePipeline import framesMCEP
+    return framesMCEP(wav_frame, order)
+
+
+def fusedMFCCKernel(wav_frame, order):
+    from FeaturePipeline import batchMFCC
+    return batchMFCC(wav_frame, order)
+
+
+# name: (kernel, feature width as a function of order)
+FEATURES = {
+    'lpc': (lpcKernel, lambda order: order + 1),  # BatchLPC, A(z) = 1 + a1 z^-1 + ... (audiolazy convention)
+    'sptk_lpc': (sptkLPCKernel, lambda order: order + 1),  # pysptk.sptk.lpc, gain in the first column
+    'mcep': (mcepKernel, lambda order: order + 1),
+    'mfcc': (mfccKernel, lambda order: order),
+    'fused_mcep': (fusedMCEPKernel, lambda order: order + 1),  # FeaturePipeline, batched over each chunk
+    'fused_mfcc': (fusedMFCCKernel, lambda order: order),
+}
+
+
+def precision(x):
+    # Working precision of an array: float32 stays float32, everything else is analyzed in float64
+    return np.float32 if x.dtype == np.float32 else np.float64
+
+
+def _compute(frames, win, feature, order, out):
+    # One chunk: window (if asked) and run the kernel straight into the output slice
+    if win is not None:
+        frames = windowFrames(frames, win)
+    out[:] = FEATURES[feature][0](frames, order)
+
+
+def _timedCompute(frames, win, feature, order, out):
+    # _compute on a pool thread, reporting (thread, busy seconds) to the profiler
+    tic = time.perf_counter()
+    _compute(frames, win, feature, order, out)
+    return threading.current_thread().name, time.perf_counter() - tic
+
+
+# %% 线程池 & 进程池
+_executor = None
+_pool = None
+_shipped = set()  # AnalysisCache keys already sent to the workers of _pool
+
+
+def getExecutor(workers=None):
+    """
+    Persistent thread pool, re-created only when a different number of workers is requested
+    :param workers: number of threads, default the number of cores
+    """
+    global _executor
+    workers = os.cpu_count() if workers is None else workers
+    if _executor is None or _executor._max_workers != workers:
+        closeExecutor()
+        _executor = ThreadPoolExecutor(workers)
+    return _executor
+
+
+def closeExecutor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+def getPool(processes=None):
+    """
+    Persistent worker pool, re-created only when a different number of processes is requested
+    :param processes: number of workers, default the number of cores
+    """
+    global _pool
+    processes = os.cpu_count() if processes is None else processes
+    if _pool is None or _pool._processes != processes:
+        closePool()
+        if os.name == 'posix':  # Workers must inherit the tracker, or each of them reports the shared blocks as leaked
+            resource_tracker.ensure_running()
+        ctx = multiprocessing.get_context()
+        if ctx.get_start_method() == 'forkserver':  # Workers fork from a server that has already imported this module
+            ctx.set_forkserver_preload([__name__])
+        _pool = ctx.Pool(processes)
+    return _pool
+
+
+def closePool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+    _shipped.clear()
+
+
+atexit.register(closeExecutor)
+atexit.register(closePool)
+
+
+# The function used by multiprocessing can't be set as function's function
+def _processTask(task):
+    # Attach the shared source and output, rebuild this worker's frame range and compute it in place
+    src_name, src_shape, frame_len, hop, win, out_name, out_shape, start, stop, feature, order, entries, dtype = task
+    if entries:
+        AnalysisCache.install(entries)  # Matrices precomputed by the parent; a worker that missed them builds its own
+    tic = time.perf_counter()
+    src_shm = shared_memory.SharedMemory(name=src_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    try:
+        src = np.ndarray(src_shape, dtype=dtype, buffer=src_shm.buf)
+        out = np.ndarray(out_shape, dtype=dtype, buffer=out_shm.buf)
+        frames = src if hop is None else frameView(src, frame_len, hop)  # Whole frame matrix or the padded signal
+        _compute(frames[start:stop], win, feature, order, out[start:stop])
+        del src, out, frames
+    finally:
+        src_shm.close()
+        out_shm.close()
+    return os.getpid(), time.perf_counter() - tic
+
+
+def _workerBusy(timings):
+    # [(worker, seconds), ...] -> {worker: (busy seconds, tasks)}
+    busy = {}
+    for worker, seconds in timings:
+        total, tasks = busy.get(worker, (0., 0))
+        busy[worker] = (total + seconds, tasks + 1)
+    return busy
+
+
+def _processRun(source, frame, frame_len, hop, win, feature, order, workers):
+    p = getPool(workers)
+    dtype = source.dtype
+    out_shape = (frame, FEATURES[feature][1](order))
+    src_shm = shared_memory.SharedMemory(create=True, size=max(source.nbytes, 1))
+    out_shm = shared_memory.SharedMemory(create=True, size=max(out_shape[0] * out_shape[1] * dtype.itemsize, 1))
+    try:
+        with Profiler.stage('marshal'):
+            src = np.ndarray(source.shape, dtype=dtype, buffer=src_shm.buf)
+            src[:] = source
+        bounds = np.linspace(0, frame, min(p._processes, frame) + 1).astype(int)  # One contiguous range per worker
+        entries = None
+        if feature.startswith('fused'):  # Shipped with the first call of a configuration only, later ones reuse them
+            entries = AnalysisCache.precompute(frame_len=frame_len, order=order, dtype=dtype)
+            entries = dict((k, v) for k, v in entries.items() if k not in _shipped) or None
+            _shipped.update(entries or ())
+        task = [(src_shm.name, source.shape, frame_len, hop, win, out_shm.name, out_shape, bounds[i], bounds[i + 1],
+                 feature, order, entries, dtype) for i in range(len(bounds) - 1)]
+        with Profiler.stage('kernel:%s' % feature, frame):
+            tic = time.perf_counter()
+            timings = p.map(_processTask, task)
+            Profiler.workerTime('process', time.perf_counter() - tic, _workerBusy(timings))
+        with Profiler.stage('marshal'):
+            result = np.ndarray(out_shape, dtype=dtype, buffer=out_shm.buf).copy()
+        del src
+    finally:
+        src_shm.close()
+        src_shm.unlink()
+        out_shm.close()
+        out_shm.unlink()
+    return result
+
+
+def _threadRun(frames, win, feature, order, workers, chunk_size):
+    out = np.empty([len(frames), FEATURES[feature][1](order)], dtype=precision(frames))
+    executor = getExecutor(workers)
+    timed = Profiler.enabled()
+    with Profiler.stage('kernel:%s' % feature, len(frames)):
+        tic = time.perf_counter()
+        futures = [executor.submit(_timedCompute if timed else _compute, frames[i:i + chunk_size], win, feature,
+                                   order, out[i:i + chunk_size]) for i in range(0, len(frames), chunk_size)]
+        timings = [f.result() for f in futures]  # Re-raises any exception from the worker thread
+        if timed:
+            Profiler.workerTime('thread', time.perf_counter() - tic, _workerBusy(timings))
+    return out
+
+
+# %% 统一接口
+BACKENDS = ('serial', 'thread', 'process')
+
+
+def extract(frames, feature, backend='serial', workers=None, order=20, win=None, chunk_size=256):
+    """
+    Compute one feature for every frame with the selected backend; all backends give identical output
+    :param frames: (frame, frame_len) matrix or view; (channels, frame, frame_len) is computed as one batch of
+                   channels * frame rows and returned as (channels, frame, width)
+    :param feature: one of FEATURES ('lpc', 'sptk_lpc', 'mcep', 'mfcc', 'fused_mcep', 'fused_mfcc')
+    :param backend: 'serial', 'thread' or 'process'
+    :param workers: number of threads / processes, default the number of cores
+    :param order: analysis order
+    :param win: window applied chunk by chunk, None if the frames are already windowed
+    :param chunk_size: frames per task of the thread backend
+    :return (frame, width) feature matrix; float32 frames are analyzed and returned in float32 (the pysptk kernels
+            compute in double and round their results), anything else in float64
+    """
+    if feature not in FEATURES:
+        raise ValueError('Unknown feature %r, expected one of %s.' % (feature, ', '.join(FEATURES)))
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend %r, expected one of %s.' % (backend, ', '.join(BACKENDS)))
+    if frames.ndim > 2:
+        out = extract(frames.reshape(-1, frames.shape[-1]), feature, backend, workers, order, win, chunk_size)
+        return out.reshape(frames.shape[:-1] + out.shape[-1:])
+    frame = len(frames)
+    dtype = precision(frames)
+    if frame == 0:
+        return np.empty([0, FEATURES[feature][1](order)], dtype=dtype)
+    if backend == 'thread':
+        return _threadRun(frames, win, feature, order, workers, chunk_size)
+    if backend == 'process':
+        return _processRun(np.asarray(frames, dtype=dtype), frame, frames.shape[-1], None, win, feature, order,
+                           workers)
+    out = np.empty([frame, FEATURES[feature][1](order)], dtype=dtype)
+    with Profiler.stage('kernel:%s' % feature, frame):
+        _compute(frames, win, feature, order, out)
+    return out
+
+
+def extractWave(wav, frame, frame_len, feature, backend='serial', workers=None, order=20, chunk_size=256):
+    """
+    extract() over the hanning-windowed 50%-overlap frames of a padded signal (the readWave / getLPC layout)
+    Frames are windowed chunk by chunk and the process backend shares the signal itself rather than the frames.
+    A (channels, samples) signal is analyzed as one batch: the channels are laid end to end, so channel c's frame j is
+    frame c * samples / hop + j of the concatenation, and the frame_len / hop - 1 frames that straddle two channels are
+    computed and dropped. Every backend then sees one long signal instead of a loop over channels.
+    :param wav: padded 1-D signal, or (channels, samples) padded to a multiple of the hop size; float32 signals are
+                analyzed in float32 (loadWave(..., dtype='float32'))
+    :param frame: number of frames (per channel)
+    :param frame_len: frame length
+    :return (frame, width), or (channels, frame, width) for a multichannel signal
+    """
+    if wav.ndim > 1:
+        hop = int(frame_len / 2)
+        channels, length = wav.shape
+        if length % hop != 0:
+            raise ValueError('Multichannel signals must be padded to a multiple of the hop size (padWave).')
+        stride = length // hop
+        out = extractWave(np.ascontiguousarray(wav).reshape(-1), (channels - 1) * stride + frame if frame else 0,
+                          frame_len, feature, backend, workers, order, chunk_size)
+        return out[np.arange(channels)[:, None] * stride + np.arange(frame)]
+    dtype = precision(wav)
+    win = AnalysisCache.window(frame_len, dtype)
+    if backend == 'process' and feature in FEATURES and frame > 0:
+        return _processRun(np.asarray(wav, dtype=dtype), frame, frame_len, int(frame_len / 2), win, feature,
+                           order, workers)
+    return extract(frameView(wav, frame_len)[:frame] if frame > 0 else wav[:0], feature, backend, workers, order, win,
+                   chunk_size)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from BatchLPC import checkedLevinson
+from AnalysisCache import melFilterbank, dctMatrix, lifter, warpBasis
+from Profiler import stage
+
+
+def _rfft(x, n=None):
+    # rfft that keeps float32 input in complex64 (numpy < 2 computes and returns complex128)
+    spec = np.fft.rfft(x, n, axis=-1)
+    return spec.astype(np.complex64, copy=False) if x.dtype == np.float32 else spec
+
+
+def _autocorrelation(wav_frame, order):
+    # float64 autocorrelation of the frames that the float32 recursion could not handle
+    spec = np.fft.rfft(wav_frame.astype(np.float64), 2 * wav_frame.shape[-1], axis=-1)
+    return np.fft.irfft(spec.real ** 2 + spec.imag ** 2, axis=-1)[..., :order + 1]
+
+
+# %% 批量特征
+def batchMCEP(periodogram, order, alpha=0.35, miniter=2, maxiter=30, threshold=0.001, floor=1e-30):
+    """
+    Mel-cepstral analysis of all frames at once (the criterion of SPTK mcep), solved by batched Newton-Raphson
+    The Hessian has Toeplitz-plus-Hankel structure, so each iteration needs one (frame, bins) x (bins, 2 * order + 1)
+    product and one batched (order + 1)^2 solve.
+    :param periodogram: (frame, nfft // 2 + 1) power spectrum |X|^2 on the rfft bins; leading axes, e.g.
+                        (channels, frame, ...), are solved as one batch
+    :param order: order of mel-cepstrum
+    :param alpha: all-pass constant
+    :param miniter, maxiter, threshold: iteration control, a frame stops once its criterion changes
+                                       by < threshold, independently of the other frames of the batch
+    :param floor: periodogram floor so that silent frames stay finite
+    :return (frame, order + 1) mel-cepstrum, in float32 for a float32 periodogram; frames whose float32 Newton
+            iteration does not stay finite are redone in float64
+    """
+    if periodogram.ndim > 2:
+        c = batchMCEP(periodogram.reshape(-1, periodogram.shape[-1]), order, alpha, miniter, maxiter, threshold, floor)
+        return c.reshape(periodogram.shape[:-1] + (order + 1,))
+    nfft = 2 * (periodogram.shape[1] - 1)
+    dtype = np.float32 if periodogram.dtype == np.float32 else np.float64
+    C, wt, init = warpBasis(nfft, order, alpha, dtype)  # Cached per (nfft, order, alpha, dtype)
+    Phi = C[:, :order + 1]
+    logI = np.log(np.maximum(periodogram, dtype(floor)))
+    c = logI @ init.T  # Least-squares fit of the log periodogram
+    idx = np.arange(order + 1)
+    diff = np.abs(idx[:, None] - idx[None, :])
+    total = idx[:, None] + idx[None, :]
+    prev = np.empty(len(c), dtype=c.dtype)
+    active = np.arange(len(c))  # Frames still iterating, each one stops on its own criterion like SPTK's mcep
+    for it in range(maxiter):
+        ca = c[active]
+        R = logI[active] - 2 * ca @ Phi.T
+        E = np.exp(R)
+        eps = (wt * (E - R - 1)).sum(axis=1)
+        if it >= miniter:
+            keep = ~(np.abs(prev[active] - eps) < threshold * np.abs(eps))
+            active, ca, R, E, eps = active[keep], ca[keep], R[keep], E[keep], eps[keep]
+            if len(active) == 0:
+                break
+        prev[active] = eps
+        g = -2 * ((wt * (E - 1)) @ Phi)
+        rho = (wt * E) @ C
+        H = 2 * (rho[:, diff] + rho[:, total])
+        c[active] = ca - np.linalg.solve(H, g[:, :, None])[:, :, 0]
+    if dtype is np.float32:
+        bad = ~np.isfinite(c).all(axis=1)
+        if bad.any():
+            with stage('mcep_fallback', int(bad.sum())):
+                c[bad] = batchMCEP(periodogram[bad].astype(np.float64), order, alpha, miniter, maxiter, threshold,
+                                   floor)
+    return c
+
+
+def fusedAnalysis(wav_frame, order, fs=16000, alpha=0.35, preemph=0.97, eps=1., num_filterbanks=None, cepslift=22):
+    """
+    LPC, MCEP and MFCC of every frame from a single FFT per frame (pysptk conventions of CmpMCEP2MFCC.Analysis)
+    One 2 * frame_len rfft gives the exact linear autocorrelation for LPC; its even bins are the frame_len-point
+    spectrum used for the mel-cepstrum and, pre-emphasized in the frequency domain, for the MFCC. The frequency-domain
+    pre-emphasis equals the time-domain one when the last sample of the frame is zero, as it is for np.hanning.
+    :param wav_frame: (frame, frame_len) windowed frames, frame_len even, or (channels, frame, frame_len)
+    :param order: analysis order
+    :param fs: sampling rate (MFCC filterbank)
+    :param alpha: all-pass constant of the mel-cepstrum
+    :param preemph: pre-emphasis coefficient of the MFCC
+    :param eps: flooring value of the filterbank energies before the log
+    :param num_filterbanks: number of mel channels, default order * 2
+    :param cepslift: liftering coefficient
+    :return lpc_frame (gain, a1, ..., ap), mcep_frame, mfcc_frame, in the precision of wav_frame (float32 or float64)
+    """
+    wav_frame = np.atleast_2d(wav_frame)
+    frame_len = wav_frame.shape[-1]
+    num_filterbanks = order * 2 if num_filterbanks is None else num_filterbanks
+    frame = wav_frame[..., 0].size
+    with stage('fft', frame):
+        spec = _rfft(wav_frame, 2 * frame_len)
+        power = spec.real ** 2 + spec.imag ** 2
+    with stage('kernel:lpc', frame):
+        r = np.fft.irfft(power, 2 * frame_len, axis=-1)[..., :order + 1].astype(power.dtype, copy=False)
+        lpc, _, err = checkedLevinson(r, order, lambda bad: _autocorrelation(wav_frame[bad], order))
+        lpc[..., 0] = np.sqrt(np.maximum(err, 0))
+    with stage('kernel:mcep', frame):
+        mcep = batchMCEP(power[..., ::2], order, alpha)
+    with stage('kernel:mfcc', frame):
+        mfcc = spectrumMFCC(spec[..., ::2], order, fs, preemph, eps, num_filterbanks, cepslift)
+    return lpc, mcep, mfcc
+
+
+def spectrumMFCC(spec, order, fs=16000, preemph=0.97, eps=1., num_filterbanks=None, cepslift=22):
+    """
+    MFCC (pysptk conventions) from the nfft-point rfft of the windowed frames, pre-emphasis applied to the spectrum
+    :param spec: (frame, nfft // 2 + 1) complex spectrum
+    :return (frame, order) MFCC
+    """
+    num_filterbanks = order * 2 if num_filterbanks is None else num_filterbanks
+    nfft = 2 * (spec.shape[-1] - 1)
+    k = np.arange(spec.shape[-1])
+    dtype = spec.real.dtype
+    mag = np.abs(spec * (1 - preemph * np.exp(-2j * np.pi * k / nfft)).astype(spec.dtype))
+    fb = np.log(np.maximum(mag @ melFilterbank(fs, nfft, num_filterbanks, dtype).T, dtype.type(eps)))
+    return fb @ dctMatrix(num_filterbanks, order, dtype).T * lifter(order, cepslift, dtype)
+
+
+def batchMFCC(wav_frame, order, fs=16000, preemph=0.97, eps=1., num_filterbanks=None, cepslift=22):
+    # MFCC of every windowed frame (frame_len-point rfft, the FFT size of pysptk)
+    return spectrumMFCC(_rfft(wav_frame), order, fs, preemph, eps, num_filterbanks, cepslift)
+
+
+def framesMCEP(wav_frame, order, alpha=0.35):
+    # Mel-cepstrum of every windowed frame
+    spec = _rfft(wav_frame)
+    return batchMCEP(spec.real ** 2 + spec.imag ** 2, order, alpha)
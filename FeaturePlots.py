@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+# %% 绘图 (matplotlib is only imported here, when a figure is actually drawn)
+def plotFrame(features, i, num=1):
+    """
+    One frame of every feature matrix, in a 2 x 2 grid
+    :param features: list of (title, (frame, width) matrix)
+    :param i: frame index
+    :param num: figure number
+    """
+    import matplotlib.pyplot as plt
+    plt.figure(num)
+    for k, (title, feature) in enumerate(features):
+        plt.subplot(2, 2, k + 1)
+        plt.title(title)
+        plt.plot(feature[i,])
+    return plt.gcf()
+
+
+def plotSurfaces(features, num=3):
+    """
+    Every feature matrix as a 3-D surface over (frame, coefficient), in a 2 x 2 grid
+    :param features: list of (title, (frame, width) matrix)
+    :param num: figure number
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib import cm
+    fig = plt.figure(num)
+    for k, (title, feature) in enumerate(features):
+        ax = fig.add_subplot(2, 2, k + 1, projection='3d')
+        x, y = np.meshgrid(np.arange(0, feature.shape[0]), np.arange(0, feature.shape[1]))
+        ax.plot_surface(x.T, y.T, feature, cmap=cm.viridis)
+        ax.set_title(title)
+    return fig
+
+
+def show():
+    import matplotlib.pyplot as plt
+    plt.show()
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import warnings
+from contextlib import contextmanager
+import numpy as np
+from Framing import padWave, frameView, windowFrames
+from WaveIO import loadWave
+from Extractor import extract, extractWave, FEATURES
+import AnalysisCache
+
+VERSION = 2  # Part of every key, bump it when a kernel changes its output so that old entries are never reused
+
+
+# %% 键
+def fileDigest(filename, block=1 << 20):
+    # sha256 of the file content, read block by block
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(block), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def featureKey(digest, feature, frame_len, order):
+    """
+    Content address of one analysis: audio digest plus every parameter that changes the coefficients
+    :return hex sha256
+    """
+    params = dict(digest=digest, feature=feature, frame_len=frame_len, order=order, hop=int(frame_len / 2),
+                  window='hanning', version=VERSION)
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def _signal(filename, frame_len):
+    # Padded signal in the readWave layout, (channels, samples) for multichannel files
+    wav, fs = loadWave(filename, dtype='float64')
+    wav, frame = padWave(wav, frame_len)
+    return wav, frame, fs
+
+
+# %% 特征库
+class FeatureStore(object):
+    """
+    Content-addressed on-disk store of (frame, width) feature matrices, (channels, frame, width) for multichannel files
+    Entries are .npy files under root/<key[:2]>/<key>.npy, loaded with mmap_mode='r'; root/index.json records the size,
+    last use and origin of every entry, and the (size, mtime) -> digest of every analyzed file so that unchanged
+    files are not even re-hashed. Several stores (threads, jobs, processes) may share one root: every flush() merges
+    this store's changes into the index on disk under root/index.json.lock.
+    :param root: store directory
+    :param max_bytes: size bound, the least recently used entries are evicted beyond it; None for no bound
+    """
+
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, 'index.json')
+        os.makedirs(root, exist_ok=True)
+        self.index = self._read()
+        self._changed = set()  # Keys saved or used since the last flush
+        self._removed = set()  # Keys removed since the last flush
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + '.npy')
+
+    def _read(self):
+        if not os.path.exists(self.index_path):
+            return dict(entries={}, files={})
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    @contextmanager
+    def _lock(self, timeout=30.):
+        # Exclusive lock file around the read-merge-write of the index; a lock older than timeout is a crashed writer's
+        lock = self.index_path + '.lock'
+        while True:
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock) > timeout:
+                        os.remove(lock)
+                except OSError:
+                    pass
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock)
+
+    def flush(self):
+        """
+        Merge this store's saved, used and removed entries into the index on disk and write it atomically
+        Entries written by other stores on the same root since this one read the index are kept, and the in-memory
+        index is refreshed with them.
+        """
+        with self._lock():
+            index = self._read()
+            for key in self._removed:
+                index['entries'].pop(key, None)
+            for key in self._changed:
+                if key in self.index['entries']:
+                    index['entries'][key] = self.index['entries'][key]
+            index['files'].update(self.index['files'])
+            index['entries'] = dict((k, e) for k, e in index['entries'].items() if os.path.exists(self.path(k)))
+            tmp = self.index_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp, self.index_path)
+        self.index = index
+        self._changed.clear()
+        self._removed.clear()
+
+    def digest(self, filename):
+        # File digest, recomputed only when the size or modification time changed
+        st = os.stat(filename)
+        name = os.path.abspath(filename)
+        known = self.index['files'].get(name)
+        if known and known['size'] == st.st_size and known['mtime'] == st.st_mtime_ns:
+            return known['digest']
+        digest = fileDigest(filename)
+        self.index['files'][name] = dict(size=st.st_size, mtime=st.st_mtime_ns, digest=digest)
+        return digest
+
+    def key(self, filename, feature, frame_len, order):
+        return featureKey(self.digest(filename), feature, frame_len, order)
+
+    def __contains__(self, key):
+        return key in self.index['entries'] and os.path.exists(self.path(key))
+
+    def load(self, key):
+        # Memory-mapped entry, None if it is not stored
+        if key not in self:
+            return None
+        self.index['entries'][key]['used'] = time.time()
+        self._changed.add(key)
+        return np.load(self.path(key), mmap_mode='r')
+
+    def save(self, key, data, **meta):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp.npy'
+        np.save(tmp, np.ascontiguousarray(data))
+        os.replace(tmp, path)  # Readers never see a partly written entry
+        self.index['entries'][key] = dict(meta, bytes=os.path.getsize(path), used=time.time(), shape=data.shape)
+        self._changed.add(key)
+        self.flush()  # An entry on disk is always in the index, whoever saved it
+        self.evict(keep=key)
+
+    def _drop(self, key):
+        # remove() without the flush
+        self.index['entries'].pop(key, None)
+        self._changed.discard(key)
+        self._removed.add(key)
+        if os.path.exists(self.path(key)):
+            os.remove(self.path(key))
+
+    def remove(self, key):
+        self._drop(key)
+        self.flush()
+
+    def size(self):
+        return sum(e['bytes'] for e in self.index['entries'].values())
+
+    def evict(self, max_bytes=None, keep=None):
+        """
+        Drop the least recently used entries until the store fits in max_bytes, then flush the index once
+        :param keep: key that is never evicted (the entry just saved); a warning is issued if it alone exceeds the bound
+        :return list of evicted keys
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if max_bytes is None:
+            return []
+        evicted = []
+        total = self.size()
+        for key, e in sorted(self.index['entries'].items(), key=lambda item: item[1]['used']):
+            if total <= max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= e['bytes']
+            self._drop(key)
+            evicted.append(key)
+        if keep in self.index['entries'] and self.index['entries'][keep]['bytes'] > max_bytes:
+            warnings.warn('Entry %s (%d bytes) alone exceeds the store bound of %d bytes.'
+                          % (keep, self.index['entries'][keep]['bytes'], max_bytes))
+        if evicted:
+            self.flush()
+        return evicted
+
+    # %% 分析
+    def features(self, filename, feature, frame_len, order, backend='serial', workers=None):
+        """
+        Feature matrix of a file, loaded from the store or computed (extractWave) and stored
+        :return ((frame, width) or (channels, frame, width) matrix, True if it was loaded)
+        """
+        key = self.key(filename, feature, frame_len, order)
+        data = self.load(key)
+        if data is not None:
+            return data, True
+        wav, frame, fs = _signal(filename, frame_len)
+        data = extractWave(wav, frame, frame_len, feature, backend, workers, order)
+        self.save(key, data, file=os.path.abspath(filename), feature=feature, frame_len=frame_len, order=order, fs=fs)
+        return data, False
+
+    def analyze(self, files, feature, frame_len, order, backend='serial', workers=None, incremental=True):
+        """
+        Analyze a set of files; in incremental mode only new or changed files are computed
+        :return dict filename -> 'loaded' or 'computed'
+        """
+        status = {}
+        try:
+            for filename in files:
+                if not incremental:
+                    self.remove(self.key(filename, feature, frame_len, order))
+                _, loaded = self.features(filename, feature, frame_len, order, backend, workers)
+                status[filename] = 'loaded' if loaded else 'computed'
+        finally:
+            self.flush()
+        return status
+
+    def verify(self, key, sample=8, rtol=1e-8, atol=1e-10, seed=None):
+        """
+        Recompute a random sample of frames of one entry and compare them with the stored rows
+        The source file must still hash to the stored digest, otherwise the entry is stale.
+        :return True if the entry is consistent
+        """
+        e = self.index['entries'].get(key)
+        if e is None or key not in self:
+            return False
+        filename = e['file']
+        if not os.path.exists(filename) or self.key(filename, e['feature'], e['frame_len'], e['order']) != key:
+            return False
+        stored = np.load(self.path(key), mmap_mode='r')
+        wav, frame, _ = _signal(filename, e['frame_len'])
+        if stored.shape != wav.shape[:-1] + (frame, FEATURES[e['feature']][1](e['order'])):
+            return False
+        if frame == 0:
+            return True
+        idx = np.sort(np.random.default_rng(seed).choice(frame, min(sample, frame), replace=False))
+        frames = windowFrames(frameView(wav, e['frame_len'])[..., idx, :], AnalysisCache.window(e['frame_len']))
+        return bool(np.allclose(extract(frames, e['feature'], order=e['order']), stored[..., idx, :], rtol=rtol,
+                                atol=atol))
+
+    def verifyAll(self, sample=8, remove=False, seed=None):
+        """
+        verify() every entry
+        :param remove: drop the stale entries
+        :return list of stale keys
+        """
+        stale = [key for key in list(self.index['entries']) if not self.verify(key, sample, seed=seed)]
+        if remove:
+            for key in stale:
+                self._drop(key)
+        self.flush()
+        return stale
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Content-addressed LPC / MCEP / MFCC feature store')
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--store', default='feature_store')
+    parser.add_argument('--feature', default='lpc', choices=sorted(FEATURES))
+    parser.add_argument('--frame-len', type=int, default=512)
+    parser.add_argument('--order', type=int, default=20)
+    parser.add_argument('--backend', default='serial')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--max-mb', type=float, help='size bound of the store')
+    parser.add_argument('--full', action='store_true', help='recompute every file instead of only new / changed ones')
+    parser.add_argument('--verify', type=int, metavar='FRAMES', help='check FRAMES random frames of every entry')
+    args = parser.parse_args()
+    store = FeatureStore(args.store, None if args.max_mb is None else int(args.max_mb * 1024 ** 2))
+    tic = time.time()
+    for filename, state in store.analyze(args.files, args.feature, args.frame_len, args.order, args.backend,
+                                         args.workers, not args.full).items():
+        print('%-10s %s' % (state, filename), file=sys.stderr)
+    if args.verify:
+        stale = store.verifyAll(args.verify, remove=True)
+        print('%d stale entries removed' % len(stale), file=sys.stderr)
+    print('%.2f seconds, %d entries, %.1f MB'
+          % (time.time() - tic, len(store.index['entries']), store.size() / 1024 ** 2), file=sys.stderr)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import AnalysisCache
+import Profiler
+
+
+# %% 分帧
+def frameCount(length, frame_len, hop=None):
+    """
+    Number of frames in a signal of the given (already padded) length
+    :param length: number of samples
+    :param frame_len: frame length
+    :param hop: hop size, default frame_len / 2 (50% overlap)
+    :return number of complete frames
+    """
+    hop = int(frame_len / 2) if hop is None else hop
+    if length < frame_len:
+        return 0
+    return (length - frame_len) // hop + 1
+
+
+def padWave(wave_data, frame_len, hop=None):
+    """
+    Zero-pad the signal to an integer multiple of the hop size
+    The signal is returned untouched when no padding is needed, otherwise it is copied once into a preallocated buffer.
+    :param wave_data: 1-D signal, or (channels, samples) as returned by loadWave for multichannel files
+    :param frame_len: frame length
+    :param hop: hop size, default frame_len / 2 (50% overlap)
+    :return (padded signal, number of frames per channel)
+    """
+    hop = int(frame_len / 2) if hop is None else hop
+    length = wave_data.shape[-1]
+    last = length % hop
+    if last != 0:  # If samples are not an integer multiple of the hop size, then zeros should be filled in.
+        with Profiler.stage('pad'):
+            padded = np.zeros(wave_data.shape[:-1] + (length + hop - last,), dtype=wave_data.dtype)
+            padded[..., :length] = wave_data
+        wave_data = padded
+    return wave_data, frameCount(wave_data.shape[-1], frame_len, hop)
+
+
+def frameView(wav, frame_len, hop=None):
+    """
+    Read-only (frame, frame_len) view on the signal, no samples are copied
+    :param wav: 1-D signal, or (channels, samples) for a (channels, frame, frame_len) view
+    :param frame_len: frame length
+    :param hop: hop size, default frame_len / 2 (50% overlap)
+    :return strided view, row i is wav[..., i * hop: i * hop + frame_len]
+    """
+    hop = int(frame_len / 2) if hop is None else hop
+    return sliding_window_view(wav, frame_len, axis=-1)[..., ::hop, :]
+
+
+# %% 加窗
+def windowFrames(frames, win, out=None):
+    """
+    Apply the window to every frame
+    :param frames: (frame, frame_len) matrix or view
+    :param win: window of length frame_len
+    :param out: output buffer; pass frames itself to window a writable matrix in place
+    :return windowed frames
+    """
+    with Profiler.stage('window', len(frames)):
+        return np.multiply(frames, win, out=out)
+
+
+def iterFrames(wav, frame_len, hop=None, win=None, block=256):
+    """
+    Yield windowed frames block by block without materializing the whole windowed matrix
+    The same (block, frame_len) buffer is reused for every block, so consumers must copy what they want to keep.
+    :param wav: 1-D signal, already padded
+    :param frame_len: frame length
+    :param hop: hop size, default frame_len / 2 (50% overlap)
+    :param win: window, default np.hanning(frame_len)
+    :param block: number of frames per block
+    :return generator of (index of the first frame, windowed frames)
+    """
+    win = AnalysisCache.window(frame_len) if win is None else win
+    view = frameView(wav, frame_len, hop)
+    frame = view.shape[0]
+    buf = np.empty([min(block, frame), frame_len], dtype=np.result_type(wav, win))
+    for start in range(0, frame, block):
+        stop = min(start + block, frame)
+        out = buf[:stop - start]
+        windowFrames(view[start:stop], win, out=out)
+        yield start, out
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+from functools import lru_cache
+import numpy as np
+from IIRFilters import BANKS, designBank
+
+
+# %% 频率响应
+@lru_cache(maxsize=32)
+def _cachedBasis(key, fs):
+    freqs = np.frombuffer(key, dtype=np.float64)
+    w = 2 * np.pi * freqs / fs
+    basis = np.exp(-1j * np.outer(np.arange(3), w))  # [1, e^-jw, e^-2jw] for every grid point
+    basis.flags.writeable = False
+    return basis
+
+
+def basis(freqs, fs=48000):
+    """
+    exp(-j k w), k = 0, 1, 2, on the frequency grid; cached per (grid, fs) so repeated evaluations reuse it
+    :param freqs: frequencies in Hz
+    :param fs: sampling rate
+    :return read-only (3, W) complex matrix
+    """
+    return _cachedBasis(np.ascontiguousarray(freqs, dtype=np.float64).tobytes(), fs)
+
+
+def freqzBank(h, freqs, fs=48000):
+    """
+    Complex responses of a stack of biquads in one broadcasted computation
+    :param h: (..., N, 6) coefficient stack from IIRFilters (any number of leading candidate axes)
+    :param freqs: frequencies in Hz, W points
+    :param fs: sampling rate
+    :return (per-filter responses (..., N, W), cascaded response (..., W))
+    """
+    h = np.asarray(h, dtype=np.float64)
+    E = basis(freqs, fs)
+    H = (h[..., :3] @ E) / (h[..., 3:] @ E)
+    return H, np.prod(H, axis=-2)
+
+
+def magnitudeDB(H):
+    return 20 * np.log10(np.maximum(np.abs(H), 1e-12))
+
+
+# %% 均衡曲线拟合
+def _unpack(p, has_gain, n):
+    f0 = np.exp(p[..., :n])
+    Q = np.exp(p[..., n:2 * n])
+    gain = np.zeros(p.shape[:-1] + (n,))
+    gain[..., has_gain] = p[..., 2 * n:]
+    return f0, gain, Q
+
+
+def fitEQ(freqs, target_db, types, f0, gain=0., Q=1., fs=48000, weight=None, f_range=(10., None),
+          q_range=(0.1, 30.), gain_range=(-24., 24.), **kwargs):
+    """
+    Fit a cascade of peakNotch / shelf / ... bands to a target magnitude response (least squares in dB)
+    All finite-difference candidates of an iteration are designed with designBank and evaluated with freqzBank in one
+    batch, so each Jacobian costs a single vectorized evaluation.
+    :param freqs: frequencies in Hz
+    :param target_db: target magnitude in dB on freqs
+    :param types: filter type per band (keys of IIRFilters.BANKS)
+    :param f0, gain, Q: initial band parameters (broadcast to the number of bands); a gain of exactly 0 dB makes
+                        the band's f0 and Q invisible to the gradient, so start from a small non-zero gain
+    :param fs: sampling rate
+    :param weight: optional weight per frequency
+    :param f_range, q_range, gain_range: parameter bounds, f_range[1] defaults to 0.49 * fs
+    :param kwargs: passed to scipy.optimize.least_squares
+    :return (f0, gain, Q, h, result): fitted parameters, their (N, 6) coefficients and the least_squares result
+    """
+    from scipy.optimize import least_squares
+    types = np.asarray(types).ravel()
+    n = len(types)
+    has_gain = np.array([BANKS[t][1] for t in types])
+    f0, gain, Q = (np.broadcast_to(np.asarray(v, dtype=np.float64), (n,)) for v in (f0, gain, Q))
+    target_db = np.asarray(target_db, dtype=np.float64)
+    weight = np.ones_like(target_db) if weight is None else np.sqrt(np.asarray(weight, dtype=np.float64))
+    f_hi = 0.49 * fs if f_range[1] is None else f_range[1]
+    p0 = np.concatenate((np.log(f0), np.log(Q), gain[has_gain]))
+    lo = np.concatenate((np.full(n, np.log(f_range[0])), np.full(n, np.log(q_range[0])),
+                         np.full(has_gain.sum(), gain_range[0])))
+    hi = np.concatenate((np.full(n, np.log(f_hi)), np.full(n, np.log(q_range[1])),
+                         np.full(has_gain.sum(), gain_range[1])))
+
+    def residual(p):
+        # p is (P,) or a (..., P) batch of candidates
+        f, g, q = _unpack(p, has_gain, n)
+        h = designBank(np.broadcast_to(types, f.shape), f, g, q, fs).reshape(f.shape + (6,))
+        _, H = freqzBank(h, freqs, fs)
+        return (magnitudeDB(H) - target_db) * weight
+
+    def jacobian(p):
+        step = 1e-6 * np.maximum(np.abs(p), 1)
+        candidates = p + np.diag(step)  # One perturbed parameter vector per row, all evaluated together
+        return ((residual(candidates) - residual(p)) / step[:, None]).T
+
+    p0 = np.clip(p0, lo, hi)
+    kwargs.setdefault('x_scale', 'jac')  # log f0 / log Q and dB gains have very different sensitivities
+    result = least_squares(residual, p0, jac=jacobian, bounds=(lo, hi), **kwargs)
+    f, g, q = _unpack(result.x, has_gain, n)
+    return f, g, q, designBank(types, f, g, q, fs), result
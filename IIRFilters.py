@@ -187,3 +187,169 @@ def notch(f0, Q=1., fs=48000):
     a = np.array([a0, a1, a2])
     h = np.hstack((b / a[0], a / a[0]))
     return h
+
+
+# %% Vectorized filter banks
+# The *Bank functions accept arrays for f0 / gain / Q (broadcast against each other) and return an (N, 6) matrix whose
+# rows are the [b0, b1, b2, a0, a1, a2] coefficients of the scalar functions above. With dtype='float32' the design
+# still runs in float64 (1 - cos(w0) cancels catastrophically in float32 at low f0) and only the result is rounded.
+def _terms(f0, Q, fs, gain=None):
+    w0 = 2 * np.pi * np.asarray(f0, dtype=float) / fs
+    alpha = np.sin(w0) / (2 * np.asarray(Q, dtype=float))
+    cos_w0 = np.cos(w0)
+    if gain is None:
+        cos_w0, alpha = np.broadcast_arrays(cos_w0, alpha)
+        return cos_w0.ravel(), alpha.ravel()
+    A = np.sqrt(10 ** (np.asarray(gain, dtype=float) / 20))
+    cos_w0, alpha, A = np.broadcast_arrays(cos_w0, alpha, A)
+    return cos_w0.ravel(), alpha.ravel(), A.ravel()
+
+
+def stable(h):
+    """
+    Whether each biquad's poles lie strictly inside the unit circle (stability triangle |a2| < 1, |a1| < 1 + a2)
+    :param h: (N, 6) or (6,) coefficients
+    :return boolean array of length N
+    """
+    h = np.atleast_2d(h)
+    a1 = h[:, 4] / h[:, 3]
+    a2 = h[:, 5] / h[:, 3]
+    return (np.abs(a2) < 1) & (np.abs(a1) < 1 + a2)
+
+
+def _stack(b0, b1, b2, a0, a1, a2, dtype='float64'):
+    h = np.stack(np.broadcast_arrays(b0, b1, b2, a0, a1, a2), axis=-1)
+    h = h / h[:, 3:4]
+    if np.dtype(dtype) == np.float64:
+        return h
+    rounded = h.astype(dtype)
+    broken = stable(h) & ~stable(rounded)
+    if broken.any():
+        raise ValueError('%d filter(s) become unstable when rounded to %s, design them in float64.'
+                         % (broken.sum(), np.dtype(dtype).name))
+    return rounded
+
+
+def lowPassBank(f0, Q=1., fs=48000, dtype='float64'):
+    """
+    Vectorized lowPass
+    :return (N, 6) coefficient matrix
+    """
+    cos_w0, alpha = _terms(f0, Q, fs)
+    return _stack((1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2, 1 + alpha, -2 * cos_w0, 1 - alpha, dtype=dtype)
+
+
+def highPassBank(f0, Q=1., fs=48000, dtype='float64'):
+    """
+    Vectorized highPass
+    :return (N, 6) coefficient matrix
+    """
+    cos_w0, alpha = _terms(f0, Q, fs)
+    return _stack((1 + cos_w0) / 2, -1 - cos_w0, (1 + cos_w0) / 2, 1 + alpha, -2 * cos_w0, 1 - alpha, dtype=dtype)
+
+
+def bandPassBank(f0, Q=1., fs=48000, type=0, dtype='float64'):
+    """
+    Vectorized bandPass
+    :param type: 0) constant 0 dB peak gain; 1) constant skirt gain, peak gain = Q
+    :param dtype: precision of the returned coefficients
+    :return (N, 6) coefficient matrix
+    """
+    cos_w0, alpha = _terms(f0, Q, fs)
+    if type == 0:
+        b0 = alpha
+    else:  # sin(w0) / 2 = Q * alpha
+        w0 = 2 * np.pi * np.asarray(f0, dtype=float) / fs
+        b0 = np.broadcast_to(np.sin(w0) / 2, np.broadcast(w0, np.asarray(Q)).shape).ravel()
+    return _stack(b0, 0., -b0, 1 + alpha, -2 * cos_w0, 1 - alpha, dtype=dtype)
+
+
+def allPassBank(f0, Q=1., fs=48000, dtype='float64'):
+    """
+    Vectorized allPass
+    :return (N, 6) coefficient matrix
+    """
+    cos_w0, alpha = _terms(f0, Q, fs)
+    return _stack(1 - alpha, -2 * cos_w0, 1 + alpha, 1 + alpha, -2 * cos_w0, 1 - alpha, dtype=dtype)
+
+
+def lowShelfBank(f0, gain=0., Q=1., fs=48000, dtype='float64'):
+    """
+    Vectorized lowShelf
+    :return (N, 6) coefficient matrix
+    """
+    cos_w0, alpha, A = _terms(f0, Q, fs, gain)
+    sa = 2 * np.sqrt(A) * alpha
+    return _stack(A * ((A + 1) - (A - 1) * cos_w0 + sa), 2 * A * ((A - 1) - (A + 1) * cos_w0),
+                  A * ((A + 1) - (A - 1) * cos_w0 - sa), (A + 1) + (A - 1) * cos_w0 + sa,
+                  -2 * ((A - 1) + (A + 1) * cos_w0), (A + 1) + (A - 1) * cos_w0 - sa, dtype=dtype)
+
+
+def highShelfBank(f0, gain=0., Q=1., fs=48000, dtype='float64'):
+    """
+    Vectorized highShelf
+    :return (N, 6) coefficient matrix
+    """
+    cos_w0, alpha, A = _terms(f0, Q, fs, gain)
+    sa = 2 * np.sqrt(A) * alpha
+    return _stack(A * ((A + 1) + (A - 1) * cos_w0 + sa), -2 * A * ((A - 1) + (A + 1) * cos_w0),
+                  A * ((A + 1) + (A - 1) * cos_w0 - sa), (A + 1) - (A - 1) * cos_w0 + sa,
+                  2 * ((A - 1) - (A + 1) * cos_w0), (A + 1) - (A - 1) * cos_w0 - sa, dtype=dtype)
+
+
+def peakNotchBank(f0, gain=0., Q=1., fs=48000, dtype='float64'):
+    """
+    Vectorized peakNotch
+    :return (N, 6) coefficient matrix
+    """
+    cos_w0, alpha, A = _terms(f0, Q, fs, gain)
+    return _stack(1 + alpha * A, -2 * cos_w0, 1 - alpha * A, 1 + alpha / A, -2 * cos_w0, 1 - alpha / A, dtype=dtype)
+
+
+def notchBank(f0, Q=1., fs=48000, dtype='float64'):
+    """
+    Vectorized notch
+    :return (N, 6) coefficient matrix
+    """
+    cos_w0, alpha = _terms(f0, Q, fs)
+    return _stack(1., -2 * cos_w0, 1., 1 + alpha, -2 * cos_w0, 1 - alpha, dtype=dtype)
+
+
+# name: (bank function, whether it takes a gain)
+BANKS = {
+    'lowPass': (lowPassBank, False),
+    'highPass': (highPassBank, False),
+    'bandPass': (bandPassBank, False),
+    'allPass': (allPassBank, False),
+    'lowShelf': (lowShelfBank, True),
+    'highShelf': (highShelfBank, True),
+    'peakNotch': (peakNotchBank, True),
+    'notch': (notchBank, False),
+}
+
+
+def designBank(types, f0, gain=0., Q=1., fs=48000, dtype='float64'):
+    """
+    Mixed-type filter bank in one call, every filter type is designed in a single vectorized pass
+    :param types: filter type names (keys of BANKS), one per band
+    :param f0: center frequencies
+    :param gain: gains, ignored by the types without gain
+    :param Q: quality factors
+    :param fs: sampling rate
+    :param dtype: precision of the returned coefficients, 'float64' or 'float32' (designed in float64, then rounded)
+    :return (N, 6) coefficient matrix in the order of types
+    """
+    types = np.asarray(types)
+    f0, gain, Q = (np.broadcast_to(np.asarray(v, dtype=float), types.shape).ravel() for v in (f0, gain, Q))
+    types = types.ravel()
+    h = np.empty([len(types), 6], dtype=dtype)
+    for name in np.unique(types):
+        if name not in BANKS:
+            raise ValueError('Unknown filter type %r, expected one of %s.' % (name, ', '.join(BANKS)))
+        idx = np.flatnonzero(types == name)
+        bank, has_gain = BANKS[name]
+        if has_gain:
+            h[idx] = bank(f0[idx], gain[idx], Q[idx], fs, dtype=dtype)
+        else:
+            h[idx] = bank(f0[idx], Q[idx], fs, dtype=dtype)
+    return h
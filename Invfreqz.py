@@ -1,4 +1,5 @@
 import numpy as np
+import Profiler
 
 """
 Input variables:
@@ -11,125 +12,327 @@ gauss - whether to use Gauss-Newton method, default False
 real - whether real or complex filter, default True
 maxiter - maximum number of iteration when using Gauss-Newton method, default 30
 tol - tolerance when using Gauss-Newton method, default 0.01
+dtype - precision of the frequency-grid arithmetic, 'complex128' (default) or 'complex64'. In complex64 the basis,
+        Jacobians and normal-equation products over len(w) run in single precision, while the small (nb + na)^2 solves
+        are promoted to double (forming D^H D squares the condition number, which single precision cannot absorb).
+        The coefficients are always returned in double precision.
+max_cond - complex64 only: responses whose normal matrix has a larger condition number are refitted in complex128,
+        default sqrt(1 / eps32) ~ 2900, i.e. about half of the single-precision digits survive the rounding of the
+        grid arithmetic (poles close to z = 1, such as low-frequency shelves, easily reach 1e6 - 1e9).
+        The refitted responses are counted by the 'invfreqz_fallback' profiler stage.
 """
 
 
-def invfreqz(h, w, nb, na, wt=None, gauss=True, real=True, maxiter=100, tol=0.01):
+def basis(w, nb, na, dtype='complex128'):
+    # exp(-j k w) for k = 0 .. max(nb, na), shape (len(w), max(nb, na) + 1); computed once per frequency grid
+    w = np.asarray(w, dtype=np.float64)
+    return np.exp(-1j * np.outer(w, np.arange(max(nb, na) + 1))).astype(dtype, copy=False)
+
+
+def _response(OM, b, a, nb, na):
+    # B(w) / A(w) on the grid, in the precision of the basis
+    return (OM[:, :nb] @ b.astype(OM.dtype)) / (OM[:, :na + 1] @ a.astype(OM.dtype))
+
+
+def _solve(R, Vd):
+    R = R.astype(np.result_type(R, np.float64), copy=False)  # Always solved in double precision
+    Vd = Vd.astype(R.dtype, copy=False)
+    try:
+        return np.linalg.solve(R, Vd)
+    except np.linalg.LinAlgError:
+        return np.linalg.lstsq(R, Vd, rcond=None)[0]
+
+
+def _illConditioned(R, dtype, max_cond=None):
+    # Normal matrices formed in complex64 that are too ill-conditioned for it: the rounding of the grid arithmetic
+    # perturbs the solution by about cond(R) * eps32
+    if np.dtype(dtype) != np.complex64:
+        return np.zeros(R.shape[:-2], dtype=bool)
+    max_cond = np.sqrt(1 / np.finfo(np.float32).eps) if max_cond is None else max_cond
+    return np.linalg.cond(R.astype(np.result_type(R, np.float64))) > max_cond
+
+
+def _normal(D, e, real):
+    # Normal equations D^H D x = D^H e of the (weighted) least-squares problem
+    DH = D.conj().T
+    R = DH @ D
+    Vd = DH @ e
+    if real:
+        return R.real, Vd.real
+    return R, Vd
+
+
+def _gaussNewton(h, OM, Wa, Wb, wf, b, a, nb, na, real, maxiter, tol):
+    # Damped Gauss-Newton iteration on the output error, starting from (b, a)
+    # return - b, a, number of iterations, final Vcap and whether the line search bailed out (st)
+    a = polystab(a)
+    GC = _response(OM, b, a, nb, na)
+    e = (GC - h) * wf
+    Vcap = np.vdot(e, e).real
+    t = np.append(a[1:na + 1], b[0:nb])
+    gndir = 2 * tol + 1
+    l = 0
+    st = 0
+    while (np.linalg.norm(gndir) > tol) and (l < maxiter) and (st != 1):
+        l = l + 1
+        A = OM[:, :na + 1] @ a.astype(OM.dtype)
+        D3 = np.hstack((Wa * (-GC / A)[:, None], Wb / A[:, None]))  # Jacobian, weights already folded in
+        e = (GC - h) * wf
+        R, Vd = _normal(D3, e, real)
+        gndir = _solve(R, Vd)  # formula 12 in reference
+        ll = 0
+        k = 1
+        V1 = Vcap + 1
+        while (V1 > Vcap) and (ll < 20):
+            t1 = t - k * gndir
+            if ll == 19:
+                t1 = t
+            a = polystab(np.append([1], t1[0:na]))
+            b = t1[na:(na + nb)]
+            GC = _response(OM, b, a, nb, na)
+            V1_a = (GC - h) * wf
+            V1 = np.vdot(V1_a, V1_a).real
+            t1 = np.append(a[1:(na + 1)], b[0:nb])
+            k = k / 2
+            ll = ll + 1
+            if ll == 20:
+                st = 1
+            if ll == 10:
+                gndir = Vd / np.linalg.norm(R) * R.shape[0]
+                k = 1
+        t = t1
+        Vcap = V1
+    return b, a, l, Vcap, st == 1
+
+
+def _prepare(w, nb, na, wt, n, dtype='complex128'):
+    # Frequency-grid quantities shared by every response fitted on the same w / nb / na / wt
+    OM = basis(w, nb - 1, na, dtype)
+    real = OM.real.dtype
+    wf = np.ones(n, dtype=real) if wt is None else np.sqrt(np.asarray(wt, dtype=np.float64)).astype(real)
+    Wa = OM[:, 1:(na + 1)] * wf[:, None]
+    Wb = OM[:, 0:nb] * wf[:, None]
+    return OM, wf, Wa, Wb
+
+
+def invfreqz(h, w, nb, na, wt=None, gauss=True, real=True, maxiter=100, tol=0.01, dtype='complex128',
+             max_cond=None):
+    h_in = h
+    h = np.asarray(h, dtype=dtype)
     if len(h) != len(w):
         raise ValueError('H and W should be of equal length.')
     nb = nb + 1
-    nm = max(nb - 1, na)
-    OM_a = np.mat(np.arange(0, nm + 1))
-    OM_m = OM_a.T * np.mat(w)
-    OM = np.exp(-1j * OM_m)
-    Dva_a = np.transpose(OM[1:(na + 1)])
-    h_t = np.transpose(np.mat(h))
-    Dva_b = h_t * np.mat(np.ones(na))
-    Dva = np.multiply(Dva_a, Dva_b)
-    Dvb = -np.transpose(OM[0:nb])
-    D_a = np.hstack((Dva, Dvb))
-    if wt is None:
-        wf = np.transpose(np.mat(np.ones_like(h)))
-    else:
-        wf = np.sqrt(np.transpose(np.mat(wt)))
-    D_b = wf * np.mat(np.ones((1, na + nb)))
-    D = np.multiply(D_a, D_b)
-    if real:
-        R = np.real(D.H * D)
-        Vd = np.real(D.H * np.multiply(-h_t, wf))  # input_h .* weight, Valid value
-    else:
-        R = D.H * D
-        Vd = D.H * np.multiply(-h_t, wf)
-    try:
-        th = np.linalg.solve(R, Vd)
-    except np.linalg.LinAlgError:
-        th = np.linalg.lstsq(R, Vd, rcond=None)
-        th = th[0]
-    th = th.getA()
-    tht = th.T
-    a = np.append([1], tht[0][0:na])
-    b = tht[0][na:(na + nb)]
+    OM, wf, Wa, Wb = _prepare(w, nb, na, wt, len(h), dtype)
+    D = np.hstack((Wa * h[:, None], -Wb))
+    R, Vd = _normal(D, -h * wf, real)  # input_h .* weight, Valid value
+    if _illConditioned(R, dtype, max_cond):
+        with Profiler.stage('invfreqz_fallback', 1):
+            return invfreqz(h_in, w, nb - 1, na, wt, gauss, real, maxiter, tol)
+    th = _solve(R, Vd)
+    a = np.append([1], th[0:na])
+    b = th[na:(na + nb)]
     if not gauss:
         return b, a
-    else:
-        indb = np.arange(len(b))
-        indg = np.arange(len(a))
-        a = polystab(a)
-        GC_b = np.mat(b) * OM[indb, :]
-        GC_a = np.mat(a) * OM[indg, :]
-        GC = np.transpose(GC_b / GC_a)
-        e = np.multiply(GC - h_t, wf)
-        Vcap = e.H * e
-        t = np.mat(np.append(a[1:(na + 1)], b[0:nb])).T
-        gndir = 2 * tol + 1
-        l = 0
-        st = 0
-        while (np.linalg.norm(gndir) > tol) and (l < maxiter) and (st != 1):
-            l = l + 1
-            D31_a = np.transpose(OM[1:(na + 1), :])
-            D31_b = - GC / np.transpose(a * OM[0:(na + 1), :])
-            D31_c = np.mat(np.ones((1, na)))
-            D31 = np.multiply(D31_a, D31_b * D31_c)
-            D32_a = np.transpose(OM[0:nb, :])
-            D32_b = np.transpose(a * OM[0:(na + 1), :])
-            D32_c = np.mat(np.ones((1, nb)))
-            D32 = D32_a / (D32_b * D32_c)
-            D3_a = np.hstack((D31, D32))
-            D3_b = wf * np.mat(np.ones((1, na + nb)))
-            D3 = np.multiply(D3_a, D3_b)
-            e = np.multiply(GC - h_t, wf)
-            if real:
-                R = np.real(D3.H * D3)
-                Vd = np.real(D3.H * e)
-            else:
-                R = D3.H * D3
-                Vd = D3.H * e
-            # gndir = np.linalg.solve(R, Vd)  # formula 12 in reference
-            try:
-                gndir = np.linalg.solve(R, Vd)
-            except np.linalg.LinAlgError:
-                gndir = np.linalg.lstsq(R, Vd, rcond=None)
-                gndir = gndir[0]
-            ll = 0
-            k = 1
-            V1 = np.mat(Vcap + 1)
-            while (V1[0][0] > Vcap) and (ll < 20):
-                t1 = t - k * gndir
-                if ll == 19:
-                    t1 = t
-                t1_v = np.transpose(t1).getA()[0]
-                a = polystab(np.append([1], t1_v[0:na]))
-                t1_v[0:na] = a[1:(na + 1)]
-                b = t1_v[na:(na + nb)]
-                GC_b = np.mat(b) * OM[indb, :]
-                GC_a = np.mat(a) * OM[indg, :]
-                GC = np.transpose(GC_b / GC_a)
-                V1_a = np.multiply(GC - h_t, wf)
-                V1 = V1_a.H * V1_a
-                t1 = np.mat(np.append(a[1:(na + 1)], b[0:nb])).T
-                k = k / 2
-                ll = ll + 1
-                if ll == 20:
-                    st = 1
-                if ll == 10:
-                    gndir = Vd / np.linalg.norm(R) * R.shape[0]
-                    k = 1
-            t = t1
-            Vcap = V1[0][0]
-        return b, a
+    return _gaussNewton(h, OM, Wa, Wb, wf, b, a, nb, na, real, maxiter, tol)[:2]
+
+
+def invfreqzBatch(H, w, nb, na, wt=None, gauss=True, real=True, maxiter=100, tol=0.01, dtype='complex128',
+                  max_cond=None):
+    """
+    invfreqz for many responses sharing w, nb, na (and wt), e.g. one per analysis frame or HRTF direction
+    The basis is built once and the initial linear fits of all responses are solved as one batched system.
+    H - (M, len(w)) frequency responses
+    return - B (M, nb + 1) and A (M, na + 1)
+    """
+    H_in = np.atleast_2d(H)
+    H = np.asarray(H_in, dtype=dtype)
+    if H.shape[1] != len(w):
+        raise ValueError('H and W should be of equal length.')
+    nb = nb + 1
+    OM, wf, Wa, Wb = _prepare(w, nb, na, wt, H.shape[1], dtype)
+    D = np.concatenate((Wa[None, :, :] * H[:, :, None], np.broadcast_to(-Wb, (len(H),) + Wb.shape)), axis=2)
+    DH = np.conj(np.swapaxes(D, 1, 2))
+    R = DH @ D
+    Vd = DH @ (-H * wf)[:, :, None]
+    if real:
+        R, Vd = R.real, Vd.real
+    bad = _illConditioned(R, dtype, max_cond)
+    R = R.astype(np.result_type(R, np.float64), copy=False)  # Solved in double precision, see dtype
+    Vd = Vd.astype(R.dtype, copy=False)
+    try:
+        th = np.linalg.solve(R, Vd)[:, :, 0]
+    except np.linalg.LinAlgError:  # Fall back to per-response least squares only when some system is singular
+        th = np.array([_solve(R[i], Vd[i, :, 0]) for i in range(len(H))])
+    A = np.hstack((np.ones((len(H), 1), dtype=th.dtype), th[:, 0:na]))
+    B = th[:, na:(na + nb)]
+    if gauss:
+        for i in np.flatnonzero(~bad):
+            B[i], A[i] = _gaussNewton(H[i], OM, Wa, Wb, wf, B[i], A[i], nb, na, real, maxiter, tol)[:2]
+    if bad.any():
+        with Profiler.stage('invfreqz_fallback', int(bad.sum())):
+            B[bad], A[bad] = invfreqzBatch(H_in[bad], w, nb - 1, na, wt, gauss, real, maxiter, tol)
+    return B, A
+
+
+# Per-response convergence statistics of invfreqzDataset
+FIT_STATS = np.dtype([('iterations', np.int32), ('Vcap', np.float64), ('bailout', np.bool_), ('warm', np.bool_),
+                      ('fallback', np.bool_)])
+
+
+def _linearFit(h, Wa, Wb, wf, nb, na, real, max_cond=None):
+    # return - b, a, or None when the normal matrix is too ill-conditioned for the precision of h
+    D = np.hstack((Wa * h[:, None], -Wb))
+    R, Vd = _normal(D, -h * wf, real)
+    if _illConditioned(R, h.dtype, max_cond):
+        return None
+    th = _solve(R, Vd)
+    return th[na:(na + nb)], np.append([1], th[0:na])
+
+
+def _cost(h, OM, wf, b, a, nb, na):
+    e = (_response(OM, b, polystab(a), nb, na) - h) * wf
+    return np.vdot(e, e).real
+
+
+# The function used by multiprocessing can't be set as function's function
+def _fitShard(args):
+    # Fit a contiguous run of responses; each one may start from its predecessor's solution
+    H_in, w, nb, na, wt, real, maxiter, tol, warm_start, dtype, max_cond = args
+    H = np.asarray(H_in, dtype=dtype)
+    grid = _prepare(w, nb, na, wt, H.shape[1], dtype)
+    exact = None  # complex128 grid, built for the first ill-conditioned response
+    B = np.empty((len(H), nb), dtype=np.float64 if real else np.complex128)
+    A = np.empty((len(H), na + 1), dtype=B.dtype)
+    stats = np.zeros(len(H), dtype=FIT_STATS)
+    for i in range(len(H)):
+        h = H[i]
+        OM, wf, Wa, Wb = grid
+        fit = _linearFit(h, Wa, Wb, wf, nb, na, real, max_cond)
+        fallback = fit is None
+        if fallback:  # Refit this response in complex128
+            if exact is None:
+                exact = _prepare(w, nb, na, wt, H.shape[1])
+            h = np.asarray(H_in[i], dtype=np.complex128)
+            OM, wf, Wa, Wb = exact
+            fit = _linearFit(h, Wa, Wb, wf, nb, na, real)
+        b, a = fit
+        warm = False
+        if warm_start and i > 0 and _cost(h, OM, wf, B[i - 1], A[i - 1], nb, na) < _cost(h, OM, wf, b, a, nb, na):
+            b, a = B[i - 1], A[i - 1]  # The neighbour's solution is already closer than the equation-error fit
+            warm = True
+        B[i], A[i], l, Vcap, st = _gaussNewton(h, OM, Wa, Wb, wf, b, a, nb, na, real, maxiter, tol)
+        stats[i] = (l, Vcap, st, warm, fallback)
+    return B, A, stats
+
+
+def invfreqzDataset(H, w, nb, na, wt=None, real=True, maxiter=100, tol=0.01, processes=None, warm_start=True,
+                    shards=None, dtype='complex128', max_cond=None):
+    """
+    Gauss-Newton invfreqz over a whole dataset (HRTF directions, room responses, ...) on a process pool
+    Responses are split into contiguous shards, one task per shard, so neighbouring responses stay together. With
+    warm_start each fit starts from the previous response's (b, a) whenever that is closer than the linear fit.
+    H - (M, len(w)) frequency responses, ordered so that neighbours are similar
+    processes - number of worker processes, default the number of cores; 1 runs in this process
+    shards - number of shards, default 4 per process
+    return - B (M, nb + 1), A (M, na + 1) and a FIT_STATS structured array of length M (fallback marks the responses
+             refitted in complex128, see max_cond)
+    """
+    H = np.atleast_2d(np.asarray(H))
+    if H.shape[1] != len(w):
+        raise ValueError('H and W should be of equal length.')
+    w = np.asarray(w, dtype=np.float64)
+    nb = nb + 1
+    if processes == 1:
+        return _fitShard((H, w, nb, na, wt, real, maxiter, tol, warm_start, dtype, max_cond))
+    from Extractor import getPool
+    p = getPool(processes)
+    shards = min(len(H), 4 * p._processes if shards is None else shards)
+    bounds = np.linspace(0, len(H), shards + 1).astype(int)
+    task = [(H[bounds[i]:bounds[i + 1]], w, nb, na, wt, real, maxiter, tol, warm_start, dtype, max_cond)
+            for i in range(shards)]
+    out = p.map(_fitShard, task)
+    return (np.concatenate([o[0] for o in out]), np.concatenate([o[1] for o in out]),
+            np.concatenate([o[2] for o in out]))
+
+
+def stepDown(a):
+    """
+    Schur-Cohn step-down test: whether every root of a lies strictly inside the unit circle
+    a - polynomial coefficients (..., n + 1), highest power first as in np.roots; batched over leading axes
+    return - boolean array of the leading shape
+    """
+    a = np.asarray(a)
+    if a.ndim == 1:  # Plain Python arithmetic beats array calls on a single short polynomial
+        if a[0] == 0:
+            return False
+        p = (a / a[0]).tolist()
+        for i in range(len(p) - 1, 0, -1):
+            k = p[i]  # Reflection coefficient of order i
+            mag = abs(k) ** 2
+            if mag >= 1:
+                return False
+            p = [(p[j] - k * p[i - j].conjugate()) / (1 - mag) for j in range(i)]
+        return True
+    stable = a[..., 0] != 0
+    lead = np.where(stable, a[..., 0], 1)
+    p = a / lead[..., None]
+    with np.errstate(over='ignore', invalid='ignore'):  # Rows that already failed may blow up, they stay False
+        for i in range(a.shape[-1] - 1, 0, -1):
+            k = p[..., i]
+            mag = np.abs(k) ** 2
+            stable &= mag < 1
+            scale = np.where(mag < 1, 1 - mag, 1)
+            p = (p[..., :i] - k[..., None] * np.conj(p[..., i:0:-1])) / scale[..., None]
+    return stable
+
+
+def _reflect(v):
+    # Reflect roots outside the unit circle to 1 / conj(v); roots on or inside the circle are kept
+    out = np.abs(v) > 1
+    return np.where(out, 1 / np.conj(np.where(out, v, 1)), v)
 
 
 def polystab(a):
-    if len(a) <= 1:
+    """
+    Stabilize a polynomial by reflecting its roots into the unit circle (Matlab polystab)
+    Root finding is skipped entirely when the step-down test shows a is already stable.
+    """
+    a = np.asarray(a)
+    if len(a) <= 1 or stepDown(a):
         return a
-    else:
-        v = np.roots(a)
-        for i in range(len(v)):
-            if v[i] != 0:
-                vs = 0.5 * (np.sign(abs(v[i]) - 1) + 1)
-                v[i] = (1 - vs) * v[i] + vs / v[i].conj()
-        ind = np.nonzero(v)
-        b = a[ind[0][0]] * np.poly(v)
-        if np.iscomplex(b).any():
-            b = np.real(b)
-        return b
+    v = _reflect(np.roots(a))
+    b = a[np.flatnonzero(a)[0]] * np.poly(v)  # Leading non-zero coefficient times the monic polynomial
+    if np.isrealobj(a):
+        b = np.real(b)
+    return b
+
+
+def polystabBatch(A):
+    """
+    polystab for every row of A (M, n + 1) at once
+    Stable rows are returned untouched; the roots of the others come from one batched companion-matrix eigvals call.
+    """
+    A = np.atleast_2d(np.asarray(A))
+    n = A.shape[1] - 1
+    out = A.copy()
+    if n < 1:
+        return out
+    todo = np.flatnonzero(~stepDown(A))
+    lead = A[todo, 0]
+    for i in todo[lead == 0]:  # Leading zeros change the degree, leave those rare rows to polystab
+        b = polystab(A[i])
+        out[i] = np.concatenate((np.zeros(n + 1 - len(b)), b))
+    todo = todo[lead != 0]
+    if len(todo) == 0:
+        return out
+    comp = np.zeros((len(todo), n, n), dtype=np.result_type(A, np.float64))
+    comp[:, 0, :] = -A[todo, 1:] / A[todo, :1]
+    comp[:, np.arange(1, n), np.arange(n - 1)] = 1
+    V = _reflect(np.linalg.eigvals(comp))
+    P = np.zeros((len(todo), n + 1), dtype=np.complex128)
+    P[:, 0] = 1
+    for j in range(n):  # Multiply the monic polynomial by (z - v_j) for all rows at once
+        P[:, 1:j + 2] = P[:, 1:j + 2] - V[:, j:j + 1] * P[:, 0:j + 1]
+    P *= A[todo, :1]
+    out[todo] = P.real if np.isrealobj(A) else P
+    return out
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from Framing import frameView
+import AnalysisCache
+
+
+# %% LPC <-> LSF
+def _normalize(lpc):
+    # Prediction polynomial with a[:, 0] = 1, so the gain convention of fusedAnalysis (lpc[:, 0] = gain) also works
+    a = np.array(np.atleast_2d(lpc), dtype=float)
+    a[:, 0] = 1
+    return a
+
+
+def _polyRoots(poly):
+    # Roots of every row of a (frame, n + 1) coefficient matrix (poly[:, 0] = 1), batched companion eigenvalues
+    frame, n = poly.shape[0], poly.shape[1] - 1
+    comp = np.zeros([frame, n, n])
+    comp[:, 0, :] = -poly[:, 1:]
+    comp[:, np.arange(1, n), np.arange(n - 1)] = 1
+    return np.linalg.eigvals(comp)
+
+
+def _angles(poly):
+    # Sorted angles in (0, pi) of a real polynomial whose roots are conjugate pairs on the unit circle
+    if poly.shape[1] == 1:
+        return np.zeros([poly.shape[0], 0])
+    w = np.sort(np.abs(np.angle(_polyRoots(poly))), axis=-1)
+    return w[:, ::2]  # One angle per conjugate pair
+
+
+def lpc2lsf(lpc):
+    """
+    Line spectral frequencies of every frame
+    P(z) = A(z) + z^-(p+1) A(1/z) and Q(z) = A(z) - z^-(p+1) A(1/z) are deflated by their trivial roots at z = +-1,
+    and the remaining roots of all frames are found by one batched eigenvalue call.
+    :param lpc: (frame, order + 1) prediction coefficients, lpc[:, 0] is taken as 1
+    :return (frame, order) LSFs in radians, ascending in (0, pi)
+    """
+    a = _normalize(lpc)
+    order = a.shape[1] - 1
+    ext = np.zeros([a.shape[0], order + 2])
+    ext[:, :-1] = a
+    P = ext + ext[:, ::-1]
+    Q = ext - ext[:, ::-1]
+    if order % 2 == 0:  # P / (1 + z^-1), Q / (1 - z^-1)
+        sign = (-1.) ** np.arange(order + 2)
+        P = np.cumsum(P * sign, axis=1)[:, :-1] * sign[:-1]
+        Q = np.cumsum(Q, axis=1)[:, :-1]
+    else:  # Q / (1 - z^-2), P has no trivial root
+        Q = Q[:, :-2].copy()
+        for k in range(2, order):
+            Q[:, k] += Q[:, k - 2]
+    return np.sort(np.concatenate([_angles(P), _angles(Q)], axis=1), axis=1)
+
+
+def _polyFromAngles(w):
+    # Product of (1 - 2 cos(w_k) z^-1 + z^-2) over the columns of w, batched across frames
+    poly = np.zeros([w.shape[0], 2 * w.shape[1] + 1])
+    poly[:, 0] = 1
+    c = -2 * np.cos(w)
+    for k in range(w.shape[1]):
+        n = 2 * k + 1
+        poly[:, 1:n + 2] = poly[:, 1:n + 2] + c[:, k, None] * poly[:, :n + 1] \
+            + np.pad(poly[:, :n], ((0, 0), (1, 0)))
+    return poly
+
+
+def lsf2lpc(lsf):
+    """
+    Prediction coefficients from line spectral frequencies, inverse of lpc2lsf
+    :param lsf: (frame, order) LSFs in radians, ascending
+    :return (frame, order + 1) prediction coefficients with lpc[:, 0] = 1
+    """
+    lsf = np.atleast_2d(lsf)
+    order = lsf.shape[1]
+    P = _polyFromAngles(lsf[:, 0::2])  # The roots of P and Q interlace, Q owns the root at w = 0
+    Q = _polyFromAngles(lsf[:, 1::2])
+    if order % 2 == 0:  # Multiply back (1 + z^-1) and (1 - z^-1)
+        P = np.pad(P, ((0, 0), (0, 1))) + np.pad(P, ((0, 0), (1, 0)))
+        Q = np.pad(Q, ((0, 0), (0, 1))) - np.pad(Q, ((0, 0), (1, 0)))
+    else:  # (1 - z^-2)
+        Q = np.pad(Q, ((0, 0), (0, 2))) - np.pad(Q, ((0, 0), (2, 0)))
+    return ((P + Q) / 2)[:, :order + 1]
+
+
+# %% LPC 倒谱
+def lpc2cep(lpc, n_cep=None, gain=None):
+    """
+    Cepstrum of the all-pole model G / A(z) of every frame by the usual recursion
+    c[n] = -a[n] - sum_{k=1}^{n-1} (k / n) c[k] a[n - k], one vectorized step per coefficient
+    :param lpc: (frame, order + 1) prediction coefficients, lpc[:, 0] is taken as 1
+    :param n_cep: number of coefficients c[1] .. c[n_cep], default order
+    :param gain: (frame,) model gain G; c[0] = ln G is returned in column 0 when given, otherwise column 0 is zero
+    :return (frame, n_cep + 1) LPC cepstrum
+    """
+    a = _normalize(lpc)
+    order = a.shape[1] - 1
+    n_cep = order if n_cep is None else n_cep
+    cep = np.zeros([a.shape[0], n_cep + 1])
+    if gain is not None:
+        cep[:, 0] = np.log(gain)
+    for n in range(1, n_cep + 1):
+        k = np.arange(max(1, n - order), n)
+        acc = (cep[:, k] * a[:, n - k]) @ (k / n)
+        cep[:, n] = -acc - (a[:, n] if n <= order else 0)
+    return cep
+
+
+# %% 残差与合成
+def residual(wav, lpc_frame, frame_len, hop=None):
+    """
+    Prediction residual e[n] = sum_k a_k x[n - k] of every (unwindowed) frame with its own coefficients
+    The order samples before each frame are used as filter history (zeros before the start of the signal), so the
+    residual of a frame does not start with a transient.
+    :param wav: 1-D signal, already padded (readWave)
+    :param lpc_frame: (frame, order + 1) prediction coefficients, lpc[:, 0] is taken as 1
+    :param frame_len: frame length
+    :param hop: hop size, default frame_len / 2 (50% overlap)
+    :return (frame, frame_len) residual frames
+    """
+    a = _normalize(lpc_frame)
+    frame, order = a.shape[0], a.shape[1] - 1
+    hop = int(frame_len / 2) if hop is None else hop
+    ext = np.concatenate([np.zeros(order, dtype=wav.dtype), wav])
+    x = frameView(ext, frame_len + order, hop)[:frame]  # Frame i with its order samples of history
+    res = x[:, order:] * a[:, :1]
+    for k in range(1, order + 1):
+        res += x[:, order - k:order - k + frame_len] * a[:, k, None]
+    return res
+
+
+def history(wav, frame, frame_len, order, hop=None):
+    """
+    The order samples preceding every frame (zeros before the start), the initial state under which synthesize()
+    inverts residual() exactly
+    :return (frame, order), oldest sample first
+    """
+    hop = int(frame_len / 2) if hop is None else hop
+    ext = np.concatenate([np.zeros(order, dtype=wav.dtype), wav])
+    return frameView(ext, order, hop)[:frame]
+
+
+def synthesize(res_frame, lpc_frame, zi=None):
+    """
+    All-pole synthesis 1 / A(z) of every residual frame with its own coefficients, vectorized across frames
+    :param res_frame: (frame, frame_len) excitation
+    :param lpc_frame: (frame, order + 1) prediction coefficients, lpc[:, 0] is taken as 1
+    :param zi: (frame, order) previous outputs, oldest first (see history()); default zero state
+    :return (frame, frame_len) synthesized frames
+    """
+    a = _normalize(lpc_frame)
+    frame, order = a.shape[0], a.shape[1] - 1
+    frame_len = res_frame.shape[1]
+    buf = np.zeros([frame, order + frame_len])
+    if zi is not None:
+        buf[:, :order] = zi
+    ar = a[:, :0:-1]  # a_p .. a_1, aligned with the order previous outputs
+    for n in range(frame_len):
+        buf[:, order + n] = res_frame[:, n] - np.einsum('ij,ij->i', ar, buf[:, n:n + order])
+    return buf[:, order:]
+
+
+# %% 重叠相加
+def overlapAdd(frames, hop=None, win=None):
+    """
+    Weighted overlap-add with the hop / window layout of the analysis
+    The frames are multiplied by win, summed, and divided by the overlapping sum of win, so overlap-adding the frames
+    of a signal returns the signal (except where the window sum is zero, e.g. the first sample under np.hanning), and
+    the frames of a smoothly varying synthesis are cross-faded by the analysis window.
+    :param frames: (frame, frame_len) unwindowed frames
+    :param hop: hop size, default frame_len / 2 (50% overlap)
+    :param win: window, default the np.hanning of the analysis
+    :return 1-D signal of length (frame - 1) * hop + frame_len
+    """
+    frame, frame_len = frames.shape
+    hop = int(frame_len / 2) if hop is None else hop
+    win = AnalysisCache.window(frame_len) if win is None else win
+    length = (frame - 1) * hop + frame_len if frame else 0
+    idx = (np.arange(frame) * hop)[:, None] + np.arange(frame_len)
+    out = np.bincount(idx.ravel(), (frames * win).ravel(), minlength=length)
+    norm = np.bincount(idx.ravel(), np.broadcast_to(win, frames.shape).ravel(), minlength=length)
+    np.divide(out, norm, out=out, where=norm > 1e-10)
+    return out
+
+
+def resynthesize(res_frame, lpc_frame, hop=None, win=None, zi=None):
+    """
+    Frame-wise all-pole synthesis followed by overlap-add, the inverse of residual() with the analysis layout
+    :param res_frame: (frame, frame_len) excitation, e.g. residual() or a modified version of it
+    :param lpc_frame: (frame, order + 1) prediction coefficients
+    :param hop: hop size, default frame_len / 2 (50% overlap)
+    :param win: synthesis window, default the np.hanning of the analysis
+    :param zi: initial state of every frame (history()); with the residual of the same signal this gives it back
+    :return 1-D signal
+    """
+    return overlapAdd(synthesize(res_frame, lpc_frame, zi), hop, win)
+
+
+if __name__ == '__main__':
+    import time
+    from SimpleLPC import readWave, getLPC
+    from WaveIO import writeWave
+    tic = time.time()
+    frame_len = 512
+    order = 20
+    wav_in, frame, fs = readWave(r"hvd_001_5.wav", frame_len)
+    lpc_frame, wav_frame = getLPC(wav_in, frame, frame_len, order)
+    lsf_frame = lpc2lsf(lpc_frame)
+    cep_frame = lpc2cep(lpc_frame)
+    res_frame = residual(wav_in, lpc_frame, frame_len)
+    wav_out = resynthesize(res_frame, lsf2lpc(lsf_frame), zi=history(wav_in, frame, frame_len, order))
+    writeWave(r"hvd_001_5_resynth.wav", wav_out, fs)
+    toc = time.time()
+    print(toc - tic)
+    print('max LSF round-trip error: %g' % np.abs(lsf2lpc(lsf_frame) - lpc_frame).max())
+    print('max resynthesis error: %g' % np.abs(wav_out[1:] - wav_in[1:len(wav_out)]).max())
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import json
+import numpy as np
+from Framing import frameView, windowFrames
+from AnalysisCache import window
+from BatchLPC import batchLPC
+from FeaturePipeline import fusedAnalysis
+from IIRFilters import BANKS, designBank
+from FreqResponse import freqzBank
+from Invfreqz import invfreqzBatch
+import Profiler
+
+
+# %% 误差度量
+def coefError(x, ref):
+    """
+    Coefficient error of a reduced-precision result against the float64 reference
+    :return dict(max_abs, rel_rms): largest absolute difference and rms difference relative to the rms of ref
+    """
+    x = np.asarray(x, dtype=np.float64)
+    ref = np.asarray(ref, dtype=np.float64)
+    diff = x - ref
+    scale = np.sqrt(np.mean(ref ** 2))
+    return dict(max_abs=float(np.abs(diff).max(initial=0)),
+                rel_rms=float(np.sqrt(np.mean(diff ** 2)) / scale) if scale > 0 else 0.)
+
+
+def spectralDistance(lpc, ref, nfft=512):
+    """
+    Log-spectral distance of the all-pole models 1 / |A(w)|^2 of two LPC matrices (lpc[:, 0] is ignored)
+    :return dict(mean_db, max_db) over the frames
+    """
+    def logPower(a):
+        a = np.asarray(a, dtype=np.float64).copy()
+        a[..., 0] = 1
+        spec = np.fft.rfft(a, nfft, axis=-1)
+        return -10 * np.log10(np.maximum(spec.real ** 2 + spec.imag ** 2, 1e-30))
+    d = np.sqrt(np.mean((logPower(lpc) - logPower(ref)) ** 2, axis=-1))
+    return dict(mean_db=float(d.mean()) if d.size else 0., max_db=float(d.max(initial=0)))
+
+
+def responseError(H, ref):
+    """
+    Complex response error of every filter relative to its own peak magnitude, 20 log10(max |H - ref| / max |ref|)
+    Unlike a difference of magnitudes in dB it stays meaningful at the zeros of notches and band-passes.
+    :param H, ref: (N, W) responses
+    :return worst (largest) error over the filters, in dB
+    """
+    err = np.abs(H - ref).max(axis=-1) / np.abs(ref).max(axis=-1)
+    return float(20 * np.log10(max(err.max(initial=0), 1e-300)))
+
+
+def _fallbacks(p, name):
+    # Frames redone in float64 during a profiled call
+    return p.stages[name]['frames'] if name in p.stages else 0
+
+
+# %% 验证报告
+def validateAnalysis(wav, frame, frame_len, order, fs=16000):
+    """
+    float32 against float64 LPC (BatchLPC) and fused LPC / MCEP / MFCC (FeaturePipeline) of one padded signal
+    :param wav: padded 1-D signal
+    :return dict per analysis of coefficient errors, log-spectral distance of the LPC models and fallback counts
+    """
+    frames = {}
+    for dtype in (np.float64, np.float32):
+        frames[dtype] = windowFrames(frameView(wav.astype(dtype), frame_len)[:frame], window(frame_len, dtype))
+    report = dict(frames=frame)
+    ref = batchLPC(frames[np.float64], order)[0]
+    with Profiler.profile() as p:
+        lpc = batchLPC(frames[np.float32], order)[0]
+    report['lpc'] = dict(coef=coefError(lpc, ref), spectrum=spectralDistance(lpc, ref),
+                         fallback_frames=_fallbacks(p, 'lpc_fallback'))
+    ref = fusedAnalysis(frames[np.float64], order, fs)
+    with Profiler.profile() as p:
+        out = fusedAnalysis(frames[np.float32], order, fs)
+    report['fused'] = dict(lpc=coefError(out[0], ref[0]), lpc_spectrum=spectralDistance(out[0], ref[0]),
+                           mcep=coefError(out[1], ref[1]), mfcc=coefError(out[2], ref[2]),
+                           lpc_fallback_frames=_fallbacks(p, 'lpc_fallback'),
+                           mcep_fallback_frames=_fallbacks(p, 'mcep_fallback'))
+    return report
+
+
+def validateFilters(fs=48000, n=8):
+    """
+    float32 against float64 biquad banks (IIRFilters) and complex64 against complex128 invfreqz fits of their responses
+    Every filter type is designed at n log-spaced frequencies between 40 Hz and 0.4 fs, gains of -12 to 12 dB.
+    :return dict(biquad=..., invfreqz=...) with coefficient errors, responseError() and, for invfreqz, the number of
+            responses refitted in complex128
+    """
+    types = np.repeat(list(BANKS), n)
+    f0 = np.tile(np.geomspace(40, 0.4 * fs, n), len(BANKS))
+    gain = np.tile(np.linspace(-12, 12, n), len(BANKS))
+    Q = np.tile(np.linspace(0.5, 4, n), len(BANKS))
+    freqs = np.geomspace(20, fs / 2, 512)
+    ref = designBank(types, f0, gain, Q, fs)
+    h = designBank(types, f0, gain, Q, fs, dtype='float32')
+    H_ref = freqzBank(ref, freqs, fs)[0]
+    report = dict(biquad=dict(filters=len(types), coef=coefError(h, ref),
+                              response_db=responseError(freqzBank(h, freqs, fs)[0], H_ref)))
+    w = 2 * np.pi * freqs / fs
+    b_ref, a_ref = invfreqzBatch(H_ref, w, 2, 2)
+    with Profiler.profile() as p:
+        b, a = invfreqzBatch(H_ref, w, 2, 2, dtype='complex64')
+    fit = np.concatenate([b, a], axis=1)
+    fit_ref = np.concatenate([b_ref, a_ref], axis=1)
+    report['invfreqz'] = dict(responses=len(types), coef=coefError(fit, fit_ref),
+                              response_db=responseError(freqzBank(fit, freqs, fs)[0], freqzBank(fit_ref, freqs, fs)[0]),
+                              fallback_responses=_fallbacks(p, 'invfreqz_fallback'))
+    return report
+
+
+def validate(filename, frame_len=512, order=20):
+    """
+    Accuracy of the float32 / complex64 precision mode against the float64 / complex128 reference
+    :param filename: audio file, the first channel is analyzed
+    :return JSON-serializable dict(file, frame_len, order, analysis=validateAnalysis(), filters=validateFilters())
+    """
+    from SimpleLPC import readWave
+    wav, frame, fs = readWave(filename, frame_len)
+    if wav.ndim > 1:
+        wav = wav[0]
+    return dict(file=filename, frame_len=frame_len, order=order,
+                analysis=validateAnalysis(wav, frame, frame_len, order, fs), filters=validateFilters())
+
+
+if __name__ == '__main__':
+    import sys
+    file_names = sys.argv[1:] or [r"hvd_001_5.wav", r"es01.wav"]
+    print(json.dumps([validate(f) for f in file_names], indent=1))
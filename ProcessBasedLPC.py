@@ -1,55 +1,28 @@
 # -*- coding: utf-8 -*-
 
 import time
-import librosa
-import numpy as np
-import audiolazy.lazy_lpc as alpc
+from Framing import padWave
+from Extractor import extractWave
+from WaveIO import loadWave
+import WaveIO
 # import matplotlib.pyplot as plt
-from multiprocessing import Pool
 
 
 # %% 预处理 & 后处理
-def readWave(filename, frame_len):
-    wave_data, fs = librosa.load(filename, sr=None, mono=False, dtype='float64')
-    length = len(wave_data)
-    n = frame_len / 2
-    last = length % n
-    if last != 0:  # If samples are not an integer multiple of N/2, then zeros should be filled in.
-        new_len = length + n - last
-        wave_data = np.append(wave_data, np.zeros(int(n - last)))
-        frame = int(new_len / n - 1)
-    else:
-        frame = int(length / n - 1)
+def readWave(filename, frame_len, dtype='float64'):
+    wave_data, fs = loadWave(filename, dtype=dtype)  # np.memmap for PCM WAV, librosa for the others; 'float32' mode
+    wave_data, frame = padWave(wave_data, frame_len)  # Zeros are filled in up to an integer multiple of N/2
     return wave_data, frame, fs
 
 
 def writeWave(path, data, fs):
-    librosa.output.write_wav(path, data, fs)
+    WaveIO.writeWave(path, data, fs)  # librosa.output.write_wav has been removed from librosa
 
 
 # %% LPC模块
-# The function used by multiprocessing can't be set as function's function
-def calculateLPC(parameter):
-    return alpc.lpc(parameter[0], parameter[1]).numerator
-
-
-def getLPC(time, frame, frame_len, order):
-    n = int(frame_len / 2)
-    win = np.hanning(frame_len)
-    with Pool() as p:  # default <missing the number in Pool()>: the same with the number of cores
-        task = [(time[i * n: (i + 2) * n] * win, order) for i in range(frame)]
-        data = p.map(calculateLPC, task)
-    # The map function data return mechanism may have an error. When the speech frame is all 0, the LPCs should be all 1. 
-    # But only one element 1 is returned in the list returned by the map, and the repeated elements are all omitted.
-    # Post-processing to repair abnormal data
-    lpc_frame = np.ones([frame, order + 1])
-    for i in range(frame):
-        if len(data[i]) == 1:
-            continue
-        else:
-            lpc_frame[i,] = np.array(data[i])
-    # lpc_frame = np.array(data, np.float64)
-    return lpc_frame
+def getLPC(time, frame, frame_len, order, processes=None):
+    # The signal is shared with a persistent process pool, each worker writes a contiguous frame range in place
+    return extractWave(time, frame, frame_len, 'lpc', backend='process', workers=processes, order=order)
 
 
 # %% 主程序
@@ -64,4 +37,4 @@ if __name__ == '__main__':
     wav_in, frame, fs = readWave(file_name, frame_len)
     lpc_frame = getLPC(wav_in, frame, frame_len, order)
     toc = time.time()
-    print("%.2f mins" % ((toc - tic) / 60))
+    print(toc - tic)
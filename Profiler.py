@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import threading
+import tracemalloc
+from collections import OrderedDict
+
+_active = None
+
+
+# %% 阶段计时
+class _NullStage(object):
+    # What stage() returns while profiling is disabled: one shared object, nothing is timed or allocated
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, frames):
+        pass
+
+
+_NULL = _NullStage()
+
+
+class _Stage(object):
+    __slots__ = ('profiler', 'name', 'frames', 'tic', 'mem', 'mem_peak')
+
+    def __init__(self, profiler, name, frames):
+        self.profiler = profiler
+        self.name = name
+        self.frames = frames
+
+    def add(self, frames):
+        # Count frames that are only known inside the stage
+        self.frames += frames
+
+    def __enter__(self):
+        p = self.profiler
+        if p.memory:
+            stack = p._stack()
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:  # The enclosing stage keeps the peak reached so far, reset_peak() below would lose it
+                stack[-1].mem_peak = max(stack[-1].mem_peak, peak)
+            tracemalloc.reset_peak()
+            self.mem = self.mem_peak = current
+            stack.append(self)
+        self.tic = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.tic
+        p = self.profiler
+        peak = None
+        if p.memory:
+            stack = p._stack()
+            stack.pop()
+            self.mem_peak = max(self.mem_peak, tracemalloc.get_traced_memory()[1])
+            peak = self.mem_peak - self.mem
+            if stack:
+                stack[-1].mem_peak = max(stack[-1].mem_peak, self.mem_peak)
+        p._record(self.name, seconds, self.frames, peak)
+        return False
+
+
+# %% 性能分析器
+class Profiler(object):
+    """
+    Named stage timers, frame counters, per-worker busy / idle time and optional tracemalloc peaks
+    Stages with the same name are accumulated; stages may be nested, in which case the outer one includes the inner.
+    :param memory: also trace Python allocations (tracemalloc) and report the peak of every stage above its start;
+                   this slows allocation-heavy code down noticeably, so it is off by default. tracemalloc has one
+                   global peak, so the per-stage peaks are only exact for stages that do not overlap other threads.
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = OrderedDict()
+        self.workers = OrderedDict()
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self.wall = 0.
+        self.peak = None
+        self._tic = None
+        self._tracing = False
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, name, seconds, frames, peak):
+        with self.lock:
+            s = self.stages.get(name)
+            if s is None:
+                s = self.stages[name] = dict(calls=0, seconds=0., frames=0, peak_bytes=None)
+            s['calls'] += 1
+            s['seconds'] += seconds
+            s['frames'] += frames
+            if peak is not None:
+                s['peak_bytes'] = max(s['peak_bytes'] or 0, peak)
+
+    def stage(self, name, frames=0):
+        return _Stage(self, name, frames)
+
+    def workerTime(self, backend, wall, busy):
+        """
+        Account one parallel section
+        :param backend: 'thread' or 'process'
+        :param wall: wall-clock time of the section, seen from the caller
+        :param busy: dict worker id -> (seconds spent in tasks, number of tasks); idle is wall - busy
+        """
+        with self.lock:
+            for worker, (seconds, tasks) in busy.items():
+                key = (backend, worker)
+                w = self.workers.get(key)
+                if w is None:
+                    w = self.workers[key] = dict(busy=0., idle=0., tasks=0)
+                w['busy'] += seconds
+                w['idle'] += max(wall - seconds, 0.)
+                w['tasks'] += tasks
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        self._tic = time.perf_counter()
+
+    def stop(self):
+        self.wall += time.perf_counter() - self._tic
+        if self.memory:
+            self.peak = tracemalloc.get_traced_memory()[1]
+            if self._tracing:
+                tracemalloc.stop()
+                self._tracing = False
+
+    def records(self):
+        """
+        Flat list of dicts, one per stage, worker and memory peak, for the benchmark JSON
+        kind='stage': name, calls, seconds, frames, frames_per_sec, share (of the profiled wall time), peak_mb
+        kind='worker': backend, worker, busy, idle, tasks, utilization
+        kind='total': seconds, peak_mb
+        """
+        out = []
+        with self.lock:
+            for name, s in self.stages.items():
+                out.append(dict(kind='stage', name=name, calls=s['calls'], seconds=s['seconds'], frames=s['frames'],
+                                frames_per_sec=s['frames'] / s['seconds'] if s['frames'] and s['seconds'] else None,
+                                share=s['seconds'] / self.wall if self.wall else None,
+                                peak_mb=s['peak_bytes'] / 1024 ** 2 if s['peak_bytes'] is not None else None))
+            for (backend, worker), w in self.workers.items():
+                total = w['busy'] + w['idle']
+                out.append(dict(kind='worker', backend=backend, worker=str(worker), busy=w['busy'], idle=w['idle'],
+                                tasks=w['tasks'], utilization=w['busy'] / total if total else None))
+        out.append(dict(kind='total', seconds=self.wall, peak_mb=self.peak / 1024 ** 2 if self.peak else None))
+        return out
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.records(), f, indent=1)
+
+    def report(self):
+        # Human-readable table of records()
+        lines = ['%-24s %6s %10s %7s %10s %9s' % ('stage', 'calls', 'seconds', 'share', 'frames/s', 'peak MB')]
+        for r in self.records():
+            if r['kind'] == 'stage':
+                lines.append('%-24s %6d %10.4f %6.1f%% %10s %9s' % (
+                    r['name'], r['calls'], r['seconds'], 100 * (r['share'] or 0),
+                    '%.0f' % r['frames_per_sec'] if r['frames_per_sec'] else '-',
+                    '%.1f' % r['peak_mb'] if r['peak_mb'] is not None else '-'))
+            elif r['kind'] == 'worker':
+                lines.append('  %-7s worker %-12s busy %8.4f s  idle %8.4f s  %4d tasks  %5.1f%%' % (
+                    r['backend'], r['worker'], r['busy'], r['idle'], r['tasks'], 100 * (r['utilization'] or 0)))
+            else:
+                lines.append('total %.4f s' % r['seconds'] + ('' if r['peak_mb'] is None
+                                                                else ', peak %.1f MB' % r['peak_mb']))
+        return '\n'.join(lines)
+
+
+# %% 接口
+def stage(name, frames=0):
+    """
+    Time a block under the given name when profiling is enabled, a shared no-op otherwise
+    :param name: stage name, e.g. 'decode', 'pad', 'window', 'kernel:lpc', 'marshal'
+    :param frames: number of frames processed by the block, summed per name
+    :return context manager; its add(frames) counts frames that are only known inside the block
+    """
+    if _active is None:
+        return _NULL
+    return _active.stage(name, frames)
+
+
+def enabled():
+    return _active is not None
+
+
+def workerTime(backend, wall, busy):
+    # Profiler.workerTime on the active profiler, ignored when profiling is disabled
+    if _active is not None:
+        _active.workerTime(backend, wall, busy)
+
+
+def enable(memory=False):
+    """
+    Start collecting into a new Profiler, which becomes the target of every stage() in this process
+    :return the Profiler
+    """
+    global _active
+    disable()
+    _active = Profiler(memory)
+    _active.start()
+    return _active
+
+
+def disable():
+    """
+    Stop collecting
+    :return the Profiler that was active, or None
+    """
+    global _active
+    p, _active = _active, None
+    if p is not None:
+        p.stop()
+    return p
+
+
+class profile(object):
+    """
+    with profile() as p: ... enables profiling for the block and leaves the results in p
+    :param memory: see Profiler
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+
+    def __enter__(self):
+        return enable(self.memory)
+
+    def __exit__(self, *exc):
+        disable()
+        return False
+
+
+if __name__ == '__main__':
+    import sys
+    from SimpleLPC import readWave, getLPC
+    from CmpMCEP2MFCC import Analysis
+    frame_len = 512
+    order = 20
+    file_name = sys.argv[1] if len(sys.argv) > 1 else r"hvd_001_5.wav"
+    for backend in ('serial', 'thread', 'process', 'fused'):
+        with profile(memory=backend == 'serial') as p:
+            wav_in, frame, fs = readWave(file_name, frame_len)
+            if backend == 'serial':
+                getLPC(wav_in, frame, frame_len, order)
+            Analysis(wav_in, frame, frame_len, order, backend)
+        print('--- %s ---' % backend)
+        print(p.report())
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+import time
+import numpy as np
+import AnalysisCache
+
+
+# %% 实时分析
+class StreamingLPCAnalyzer(object):
+    """
+    Frame-by-frame LPC of live input, one analysis per hop
+    The last frame_len samples live in a ring buffer written twice (at i and i + frame_len), so the current frame is
+    always the contiguous slice ring[pos:pos + frame_len]. Window, frame, autocorrelation, coefficient and residual
+    arrays are allocated once; push() only writes into them. The lag products of the autocorrelation are order + 1
+    dot products, cheaper than an FFT for the usual orders and free of temporary arrays.
+    After the first frame_len samples, the k-th emitted frame equals frame k of getLPC on the whole signal.
+    :param frame_len: frame length
+    :param order: prediction order
+    :param hop: hop size, default frame_len / 2 (50% overlap)
+    :param residual: also compute the prediction residual of the newest hop
+    :param fs: sampling rate, only used to report the real-time budget of a hop
+    :param history: number of per-hop latencies kept
+    """
+
+    def __init__(self, frame_len=512, order=20, hop=None, residual=False, fs=None, history=1024):
+        self.frame_len = frame_len
+        self.order = order
+        self.hop = int(frame_len / 2) if hop is None else hop
+        if not 0 < self.hop <= frame_len or order >= frame_len - self.hop + 1:
+            raise ValueError('Need 0 < hop <= frame_len and order <= frame_len - hop (got %d, %d, %d).'
+                             % (frame_len, self.hop, order))
+        self.residual = residual
+        self.fs = fs
+        self.win = AnalysisCache.window(frame_len)
+        self.ring = np.zeros(2 * frame_len)
+        self.frame = np.empty(frame_len)
+        self.r = np.empty(order + 1)
+        self.lpc = np.zeros(order + 1)
+        self.refl = np.zeros(order)
+        self.err = 0.
+        self.res = np.zeros(self.hop)
+        self._tmp = np.empty(max(order + 1, self.hop))
+        self._pending = np.empty(self.hop)
+        self._filled = 0
+        self.latency = np.zeros(history)
+        self.reset()
+
+    def reset(self):
+        # Forget the signal, keep the buffers
+        self.ring[:] = 0
+        self.pos = 0
+        self.samples = 0
+        self.hops = 0
+        self._filled = 0
+
+    @property
+    def ready(self):
+        # True once a whole frame of real input is in the ring
+        return self.samples >= self.frame_len
+
+    def _write(self, block):
+        n = len(block)
+        first = min(n, self.frame_len - self.pos)
+        for offset in (0, self.frame_len):
+            self.ring[offset + self.pos:offset + self.pos + first] = block[:first]
+            self.ring[offset:offset + n - first] = block[first:]
+        self.pos = (self.pos + n) % self.frame_len
+        self.samples += n
+
+    def _levinson(self):
+        # Levinson-Durbin in place, same conventions as BatchLPC.levinson
+        lpc, refl, r, tmp = self.lpc, self.refl, self.r, self._tmp
+        lpc[:] = 0
+        lpc[0] = 1
+        refl[:] = 0
+        err = r[0]
+        for i in range(1, self.order + 1):
+            if err <= 0:  # Silence, or a perfectly predicted frame: the remaining coefficients stay zero
+                break
+            k = -(r[i] + np.dot(lpc[1:i], r[i - 1:0:-1])) / err
+            np.multiply(lpc[i - 1:0:-1], k, out=tmp[1:i])
+            np.add(lpc[1:i], tmp[1:i], out=lpc[1:i])
+            lpc[i] = k
+            refl[i - 1] = k
+            err *= 1 - k * k
+        self.err = max(err, 0.)
+
+    def push(self, block):
+        """
+        Analyze one hop of input, no array is allocated
+        :param block: exactly hop new samples
+        :return lpc (order + 1,) with lpc[0] = 1; the array is reused by the next call, copy it to keep it.
+                refl, err and res (residual of the newest hop) are attributes updated in place.
+        """
+        tic = time.perf_counter()
+        if len(block) != self.hop:
+            raise ValueError('push() takes exactly hop = %d samples, got %d.' % (self.hop, len(block)))
+        self._write(block)
+        n = self.frame_len
+        x = self.ring[self.pos:self.pos + n]  # Oldest to newest
+        np.multiply(x, self.win, out=self.frame)
+        for k in range(self.order + 1):
+            self.r[k] = np.dot(self.frame[:n - k], self.frame[k:])
+        self._levinson()
+        if self.residual:  # e[n] = sum_k a_k x[n - k] over the newest hop, on the unwindowed signal
+            start, tmp = n - self.hop, self._tmp[:self.hop]
+            np.multiply(x[start:], self.lpc[0], out=self.res)
+            for k in range(1, self.order + 1):
+                np.multiply(x[start - k:n - k], self.lpc[k], out=tmp)
+                np.add(self.res, tmp, out=self.res)
+        self.latency[self.hops % len(self.latency)] = time.perf_counter() - tic
+        self.hops += 1
+        return self.lpc
+
+    def process(self, samples):
+        """
+        Feed a block of any length; yields the LPC of every completed hop once a whole frame has been received
+        :return generator of lpc (the reused array, see push())
+        """
+        i = 0
+        while i < len(samples):
+            n = min(self.hop - self._filled, len(samples) - i)
+            self._pending[self._filled:self._filled + n] = samples[i:i + n]
+            self._filled += n
+            i += n
+            if self._filled == self.hop:
+                self._filled = 0
+                lpc = self.push(self._pending)
+                if self.ready:
+                    yield lpc
+
+    def stats(self):
+        """
+        Per-hop processing time over the last hops, in seconds
+        :return dict with hops, mean, p50, p99, max and, when fs is known, the hop duration (budget) and the
+                real-time factor max / budget
+        """
+        lat = self.latency[:min(self.hops, len(self.latency))]
+        if len(lat) == 0:
+            return dict(hops=0)
+        out = dict(hops=self.hops, mean=float(lat.mean()), p50=float(np.percentile(lat, 50)),
+                   p99=float(np.percentile(lat, 99)), max=float(lat.max()))
+        if self.fs:
+            out['budget'] = self.hop / self.fs
+            out['rtf'] = out['max'] / out['budget']
+        return out
+
+
+if __name__ == '__main__':
+    from SimpleLPC import readWave, getLPC
+    frame_len = 512
+    order = 20
+    wav_in, frame, fs = readWave(r"hvd_001_5.wav", frame_len)
+    analyzer = StreamingLPCAnalyzer(frame_len, order, residual=True, fs=fs)
+    lpc_frame = np.array([lpc.copy() for lpc in analyzer.process(wav_in)])
+    print('max difference from getLPC: %g' % np.abs(lpc_frame - getLPC(wav_in, frame, frame_len, order)[0]).max())
+    print(analyzer.stats())
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+_sosfilt = False  # Resolved on the first block, so that importing this module does not load scipy.signal
+
+
+def _sosfiltKernel():
+    # The C kernel behind scipy.signal.sosfilt, it filters (signals, samples) in place and updates zi in place
+    global _sosfilt
+    if _sosfilt is False:
+        try:
+            from scipy.signal._sosfilt import _sosfilt
+        except ImportError:
+            _sosfilt = None
+    return _sosfilt
+
+
+def cascade(*h):
+    """
+    Stack IIRFilters coefficient vectors / (N, 6) banks into one second-order-sections matrix
+    :param h: [b0, b1, b2, a0, a1, a2] vectors or (N, 6) matrices, applied in the given order
+    :return (sections, 6) matrix normalized to a0 = 1
+    """
+    sos = np.vstack([np.atleast_2d(np.asarray(v, dtype=np.float64)) for v in h])
+    return np.ascontiguousarray(sos / sos[:, 3:4])
+
+
+class SOSFilter(object):
+    """
+    Cascaded biquad filter for block-by-block processing with persistent state
+    The filter state (zi) is carried across process() calls, so filtering a signal in blocks gives exactly the
+    same output as filtering it in one go. With a preallocated out buffer a block costs no allocation at all.
+    :param h: IIRFilters coefficient vector(s), see cascade()
+    :param channels: number of channels, blocks are (channels, samples) or 1-D for a single channel
+    """
+
+    def __init__(self, h, channels=1):
+        self.sos = cascade(h)
+        self.channels = channels
+        self.zi = np.zeros([channels, len(self.sos), 2])  # The layout of the sosfilt kernel: (signals, sections, 2)
+
+    def reset(self):
+        self.zi[:] = 0
+
+    def process(self, x, out=None):
+        """
+        Filter one block
+        :param x: (channels, samples) block, or (samples,) when channels == 1
+        :param out: C-contiguous float64 buffer of the same shape (may be x itself to filter in place)
+        :return filtered block (out if given)
+        """
+        if out is None:
+            out = np.array(x, dtype=np.float64, order='C')
+        elif not out.flags.c_contiguous or out.dtype != np.float64:
+            raise ValueError('out must be a C-contiguous float64 array.')
+        elif out is not x:
+            np.copyto(out, x)
+        y = out.reshape(self.channels, -1)
+        kernel = _sosfiltKernel()
+        if kernel is not None:
+            kernel(self.sos, y, self.zi)
+        else:
+            from scipy.signal import sosfilt
+            y[:], zf = sosfilt(self.sos, y, axis=-1, zi=self.zi.transpose(1, 0, 2))
+            self.zi[:] = zf.transpose(1, 0, 2)
+        return out
+
+
+def filterSignal(h, x, block_size=4096):
+    """
+    Offline filtering through SOSFilter, block by block into one output array
+    :param h: IIRFilters coefficient vector(s)
+    :param x: (channels, samples) or (samples,) signal
+    :param block_size: samples per block
+    :return filtered signal
+    """
+    x = np.asarray(x, dtype=np.float64)
+    f = SOSFilter(h, 1 if x.ndim == 1 else x.shape[0])
+    y = np.empty_like(x)
+    buf = np.empty(x.shape[:-1] + (block_size,))
+    for start in range(0, x.shape[-1], block_size):
+        stop = min(start + block_size, x.shape[-1])
+        y[..., start:stop] = f.process(x[..., start:stop], out=buf if stop - start == block_size else None)
+    return y
+
+
+# %% 时变双二阶滤波
+_compiled = None
+
+
+def _timeVaryingKernel(*args):
+    # Compile _timeVaryingPy with numba on first use (not on import); without numba the vectorized _timeVaryingScan
+    global _compiled
+    if _compiled is None:
+        try:
+            from numba import njit
+            _compiled = njit(cache=True)(_timeVaryingPy)
+        except ImportError:
+            _compiled = _timeVaryingScan
+    return _compiled(*args)
+
+
+def _timeVaryingPy(x, nodes, hop, zi, out):
+    # Transposed direct form II; the coefficients move linearly from nodes[k] to nodes[k + 1] over control frame k
+    channels = x.shape[0]
+    for k in range(nodes.shape[0] - 1):
+        for j in range(hop):
+            t = (j + 1) / hop
+            b0 = nodes[k, 0] + t * (nodes[k + 1, 0] - nodes[k, 0])
+            b1 = nodes[k, 1] + t * (nodes[k + 1, 1] - nodes[k, 1])
+            b2 = nodes[k, 2] + t * (nodes[k + 1, 2] - nodes[k, 2])
+            a1 = nodes[k, 4] + t * (nodes[k + 1, 4] - nodes[k, 4])
+            a2 = nodes[k, 5] + t * (nodes[k + 1, 5] - nodes[k, 5])
+            n = k * hop + j
+            for c in range(channels):
+                xn = x[c, n]
+                y = b0 * xn + zi[c, 0]
+                zi[c, 0] = b1 * xn - a1 * y + zi[c, 1]
+                zi[c, 1] = b2 * xn - a2 * y
+                out[c, n] = y
+
+
+def _timeVaryingScan(x, nodes, hop, zi, out):
+    # _timeVaryingPy in numpy: the state update s[n + 1] = M[n] s[n] + u[n] is affine, so every state of the block
+    # follows from a doubling (Hillis-Steele) scan, log2(samples) vectorized steps instead of a loop over samples
+    t = np.arange(1, hop + 1) / hop
+    coef = (nodes[:-1, None, :] + t[:, None] * (nodes[1:] - nodes[:-1])[:, None, :]).reshape(-1, 6)
+    b0, b1, b2, a1, a2 = coef[:, 0], coef[:, 1], coef[:, 2], coef[:, 4], coef[:, 5]
+    m00, m01, m10, m11 = -a1, np.ones_like(a1), -a2, np.zeros_like(a2)  # M[n] = [[-a1, 1], [-a2, 0]]
+    u0 = (b1 - a1 * b0) * x
+    u1 = (b2 - a2 * b0) * x
+    step = 1
+    while step < len(coef):  # Compose every (M[n], u[n]) with the map of the step samples before it
+        p00, p01, p10, p11 = m00[:-step], m01[:-step], m10[:-step], m11[:-step]
+        q00, q01, q10, q11 = m00[step:], m01[step:], m10[step:], m11[step:]
+        v0, v1 = u0[:, :-step], u1[:, :-step]
+        u0 = np.concatenate([u0[:, :step], u0[:, step:] + q00 * v0 + q01 * v1], axis=1)
+        u1 = np.concatenate([u1[:, :step], u1[:, step:] + q10 * v0 + q11 * v1], axis=1)
+        m00, m01, m10, m11 = (np.concatenate([m[:step], c]) for m, c in (
+            (m00, q00 * p00 + q01 * p10), (m01, q00 * p01 + q01 * p11),
+            (m10, q10 * p00 + q11 * p10), (m11, q10 * p01 + q11 * p11)))
+        step *= 2
+    s0 = m00 * zi[:, :1] + m01 * zi[:, 1:] + u0  # State after every sample
+    s1 = m10 * zi[:, :1] + m11 * zi[:, 1:] + u1
+    out[:, 0] = b0[0] * x[:, 0] + zi[:, 0]
+    out[:, 1:] = b0[1:] * x[:, 1:] + s0[:, :-1]
+    zi[:, 0] = s0[:, -1]
+    zi[:, 1] = s1[:, -1]
+
+
+class TimeVaryingBiquad(object):
+    """
+    Biquad whose parameters follow control-rate trajectories without zipper noise
+    Each block takes one f0 / gain / Q value per control frame. The coefficients are designed for all control frames
+    in one vectorized IIRFilters bank call and then interpolated sample by sample inside a compiled kernel (numba),
+    starting from the coefficients reached at the end of the previous block. Without numba the same recursion is
+    solved by a vectorized numpy scan over the block (equal up to rounding, ~1e-9 relative). Linear interpolation of
+    normalized biquad coefficients stays inside the stability triangle, so the interpolated filter is stable whenever
+    the designs are.
+    :param kind: filter type, a key of IIRFilters.BANKS ('peakNotch', 'lowShelf', ...)
+    :param fs: sampling rate
+    :param channels: number of channels, blocks are (channels, samples) or 1-D for a single channel
+    """
+
+    def __init__(self, kind, fs=48000, channels=1):
+        import IIRFilters
+        if kind not in IIRFilters.BANKS:
+            raise ValueError('Unknown filter type %r, expected one of %s.' % (kind, ', '.join(IIRFilters.BANKS)))
+        self.bank, self.has_gain = IIRFilters.BANKS[kind]
+        self.fs = fs
+        self.channels = channels
+        self.zi = np.zeros([channels, 2])
+        self.nodes = None
+
+    def reset(self):
+        self.zi[:] = 0
+        self.nodes = None
+
+    def design(self, f0, gain=0., Q=1.):
+        # (control frames, 6) coefficient trajectory
+        f0, gain, Q = np.broadcast_arrays(np.atleast_1d(f0), gain, Q)
+        return self.bank(f0, gain, Q, self.fs) if self.has_gain else self.bank(f0, Q, self.fs)
+
+    def process(self, x, f0, gain=0., Q=1., out=None):
+        """
+        Filter one block
+        :param x: (channels, samples) block, or (samples,) when channels == 1
+        :param f0: center frequency per control frame (the block length must be a multiple of their number)
+        :param gain: gain per control frame, or a constant
+        :param Q: quality factor per control frame, or a constant
+        :param out: C-contiguous float64 buffer of the same shape
+        :return filtered block (out if given)
+        """
+        x = np.asarray(x, dtype=np.float64)
+        ctrl = self.design(f0, gain, Q)
+        samples = x.shape[-1]
+        if samples % len(ctrl) != 0:
+            raise ValueError('The block length (%d) must be a multiple of the number of control frames (%d).'
+                             % (samples, len(ctrl)))
+        if self.nodes is None:
+            self.nodes = np.empty([len(ctrl) + 1, 6])
+            self.nodes[0] = ctrl[0]  # No sweep into the very first control frame
+        elif len(self.nodes) != len(ctrl) + 1:
+            last = self.nodes[-1].copy()
+            self.nodes = np.empty([len(ctrl) + 1, 6])
+            self.nodes[0] = last
+        else:
+            self.nodes[0] = self.nodes[-1]
+        self.nodes[1:] = ctrl
+        if out is None:
+            out = np.empty(x.shape)
+        _timeVaryingKernel(x.reshape(self.channels, -1), self.nodes, samples // len(ctrl), self.zi,
+                           out.reshape(self.channels, -1))
+        return out
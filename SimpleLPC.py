@@ -1,41 +1,31 @@
 # -*- coding: utf-8 -*-
 
 import time
-import librosa
-import numpy as np
-from audiolazy import lazy_lpc
+from BatchLPC import batchLPC
+from Framing import padWave, frameView, windowFrames
+from WaveIO import loadWave
+import WaveIO
+from AnalysisCache import window
+from Profiler import stage
 # import matplotlib.pyplot as plt
 
 
-def readWave(filename, frame_len):
-    wave_data, fs = librosa.load(filename, sr=None, mono=False, dtype='float64')
-    length = len(wave_data)
-    n = frame_len / 2
-    last = length % n
-    if last != 0:  # If samples are not an integer multiple of N/2, then zeros should be filled in.
-        new_len = length + n - last
-        wave_data = np.append(wave_data, np.zeros(int(n - last)))
-        frame = int(new_len / n - 1)
-    else:
-        frame = int(length / n - 1)
+def readWave(filename, frame_len, dtype='float64'):
+    wave_data, fs = loadWave(filename, dtype=dtype)  # np.memmap for PCM WAV, librosa for the others; 'float32' mode
+    wave_data, frame = padWave(wave_data, frame_len)  # Zeros are filled in up to an integer multiple of N/2
     return wave_data, frame, fs
 
 
 def writeWave(path, data, fs):
-    librosa.output.write_wav(path, data, fs)
+    WaveIO.writeWave(path, data, fs)  # librosa.output.write_wav has been removed from librosa
 
 
 
 def getLPC(wav, frame, frame_len, order):
-    n = int(frame_len / 2)
-    win = np.hanning(frame_len)
-    wav_frame = np.empty([frame, frame_len])  # 默认float64
-    lpc_frame = np.empty([frame, order + 1])
-    for i in range(0, frame):
-        wav_frame[i, :] = wav[i * n: (i + 2) * n] * win
-        # temp = audiolazy.lazy_lpc.lpc(wav_frame[i, :], order)
-        # lpc_frame[i, :] = temp.numerator
-        lpc_frame[i, :] = lazy_lpc.lpc(wav_frame[i, :], order).numerator
+    win = window(frame_len, wav.dtype)  # np.hanning, cached per frame_len and precision
+    wav_frame = windowFrames(frameView(wav, frame_len)[..., :frame, :], win)  # 默认float64, 多通道时 (channel, frame, N)
+    with stage('kernel:lpc', frame):
+        lpc_frame, _, _ = batchLPC(wav_frame, order)  # All frames in one call instead of lazy_lpc.lpc per frame
     return lpc_frame, wav_frame
 
 
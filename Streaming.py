@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import numpy as np
+from Framing import frameCount
+from WaveIO import WaveFile
+from SimpleLPC import getLPC
+from CmpMCEP2MFCC import Analysis
+
+
+# %% 分块读取
+class _SoundFileReader(object):
+    # Fallback sample source for compressed formats
+    def __init__(self, filename):
+        import soundfile as sf
+        self.file = sf.SoundFile(filename)
+        self.channels = self.file.channels
+        self.fs = self.file.samplerate
+
+    def readInto(self, out):
+        return self.file.read(len(out), dtype=out.dtype, out=out).shape[0]
+
+    def close(self):
+        self.file.close()
+
+
+class _WaveFileReader(object):
+    # Memory-mapped PCM / float WAV, converted block by block
+    def __init__(self, filename):
+        self.file = WaveFile(filename)
+        self.channels = self.file.channels
+        self.fs = self.file.fs
+        self.pos = 0
+
+    def readInto(self, out):
+        block = self.file.read(self.pos, self.pos + len(out), dtype=out.dtype)
+        out[:len(block)] = block
+        self.pos += len(block)
+        return len(block)
+
+    def close(self):
+        pass
+
+
+def _openReader(filename):
+    try:
+        return _WaveFileReader(filename)
+    except (ValueError, struct.error):
+        return _SoundFileReader(filename)
+
+
+def streamWave(filename, frame_len, chunk_frames=1024, hop=None, dtype='float64'):
+    """
+    Read the file block by block and yield the samples of up to chunk_frames consecutive frames
+    Consecutive blocks overlap by frame_len - hop samples (the carry-over), and the tail of the file is zero-padded to
+    an integer multiple of the hop size exactly like readWave, so framing every block gives the whole-file frames.
+    Only one (chunk_frames - 1) * hop + frame_len buffer is allocated; the yielded array is a view on it and is
+    overwritten by the next block.
+    :param filename: mono audio file
+    :param frame_len: frame length
+    :param chunk_frames: number of frames per block
+    :param hop: hop size, default frame_len / 2 (50% overlap)
+    :param dtype: sample type, the same as librosa.load
+    :return generator of (index of the first frame, samples of the block, sampling rate)
+    """
+    hop = int(frame_len / 2) if hop is None else hop
+    buf = np.zeros((chunk_frames - 1) * hop + frame_len + hop, dtype=dtype)  # One extra hop for the final padding
+    size = len(buf) - hop
+    filled = 0
+    first = 0
+    f = _openReader(filename)
+    try:
+        if f.channels != 1:
+            raise ValueError('Streaming analysis expects a mono file.')
+        eof = False
+        while not eof:
+            want = size - filled
+            got = f.readInto(buf[filled:size])
+            filled += got
+            if got < want:
+                eof = True
+                last = filled % hop
+                if last != 0:  # If samples are not an integer multiple of N/2, then zeros should be filled in.
+                    buf[filled:filled + hop - last] = 0
+                    filled += hop - last
+            frame = frameCount(filled, frame_len, hop)
+            if frame > 0:
+                yield first, buf[:(frame - 1) * hop + frame_len], f.fs
+                first += frame
+                used = frame * hop
+                buf[:filled - used] = buf[used:filled]  # Carry the overlapping samples over to the next block
+                filled -= used
+    finally:
+        f.close()
+
+
+# %% 增量分析
+def streamLPC(filename, frame_len, order, chunk_frames=1024):
+    """
+    Incremental getLPC over streamWave blocks, the concatenated output equals the whole-file getLPC
+    :return generator of (index of the first frame, lpc_frame of the block)
+    """
+    for first, wav, fs in streamWave(filename, frame_len, chunk_frames):
+        frame = frameCount(len(wav), frame_len)
+        lpc_frame, _ = getLPC(wav, frame, frame_len, order)
+        yield first, lpc_frame
+
+
+def streamAnalysis(filename, frame_len, order, chunk_frames=1024):
+    """
+    Incremental CmpMCEP2MFCC.Analysis over streamWave blocks, the concatenated output equals the whole-file Analysis
+    :return generator of (index of the first frame, lpc_frame, mcep_frame, mfcc_frame of the block)
+    """
+    for first, wav, fs in streamWave(filename, frame_len, chunk_frames):
+        frame = frameCount(len(wav), frame_len)
+        lpc_frame, mcep_frame, mfcc_frame, _ = Analysis(wav, frame, frame_len, order)
+        yield first, lpc_frame, mcep_frame, mfcc_frame
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import numpy as np
+import Profiler
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+# %% 内存映射读取
+class WaveFile(object):
+    """
+    Memory-mapped PCM / IEEE-float WAV file
+    Only the header is parsed on construction; samples stay on disk until a block is read and converted.
+    :param filename: path of the WAV file
+    :raise ValueError: if the file is not an uncompressed RIFF WAV file
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        fmt = None
+        with open(filename, 'rb') as f:
+            riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+            if riff != b'RIFF' or wave != b'WAVE':
+                raise ValueError('%s is not a RIFF WAV file.' % filename)
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    raise ValueError('%s has no data chunk.' % filename)
+                chunk_id, chunk_size = struct.unpack('<4sI', header)
+                if chunk_id == b'fmt ':
+                    fmt = f.read(chunk_size)
+                    f.seek(chunk_size % 2, 1)  # Chunks are word aligned
+                elif chunk_id == b'data':
+                    offset = f.tell()
+                    break
+                else:
+                    f.seek(chunk_size + chunk_size % 2, 1)
+        if fmt is None:
+            raise ValueError('%s has no fmt chunk.' % filename)
+        tag, self.channels, self.fs, _, block_align, self.bits = struct.unpack('<HHIIHH', fmt[:16])
+        if tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            tag = struct.unpack('<H', fmt[24:26])[0]  # The first two bytes of the sub-format GUID
+        if tag == WAVE_FORMAT_PCM and self.bits in (8, 16, 24, 32):
+            self.width = self.bits // 8
+            self._dtype = {1: np.uint8, 2: np.int16, 3: np.uint8, 4: np.int32}[self.width]
+        elif tag == WAVE_FORMAT_IEEE_FLOAT and self.bits in (32, 64):
+            self.width = self.bits // 8
+            self._dtype = {4: np.float32, 8: np.float64}[self.width]
+        else:
+            raise ValueError('%s is not PCM or IEEE-float encoded (format %d, %d bits).' % (filename, tag, self.bits))
+        self.float = tag == WAVE_FORMAT_IEEE_FLOAT
+        self.length = chunk_size // block_align
+        shape = (self.length, self.channels * 3) if self.width == 3 else (self.length, self.channels)
+        self.data = np.memmap(filename, dtype=self._dtype, mode='r', offset=offset, shape=shape)
+
+    def __len__(self):
+        return self.length
+
+    def read(self, start=0, stop=None, dtype='float64'):
+        """
+        Convert samples [start, stop) to floating point in [-1, 1), the same scaling as librosa / soundfile
+        :param start: first sample
+        :param stop: end sample, default the end of the file
+        :param dtype: 'float32' or 'float64'
+        :return 1-D array for mono files, (channels, samples) otherwise (the librosa mono=False layout)
+        """
+        raw = self.data[start:stop]
+        if self.float:
+            block = raw.astype(dtype)
+        elif self.width == 1:
+            block = (raw.astype(dtype) - 128) / 128
+        elif self.width == 3:
+            b = raw.reshape(len(raw), self.channels, 3).astype(np.int32)
+            block = ((b[..., 0] << 8 | b[..., 1] << 16 | b[..., 2] << 24) >> 8).astype(dtype) / 2 ** 23
+        else:
+            block = raw.astype(dtype) / 2 ** (self.bits - 1)
+        block = np.asarray(block, dtype=dtype)
+        return block[:, 0] if self.channels == 1 else block.T
+
+    def blocks(self, blocksize, dtype='float64'):
+        """
+        Yield the converted samples block by block
+        :param blocksize: samples per block
+        :param dtype: 'float32' or 'float64'
+        """
+        for start in range(0, self.length, blocksize):
+            yield self.read(start, start + blocksize, dtype)
+
+
+# %% 分块写入
+class WaveWriter(object):
+    """
+    PCM / IEEE-float WAV writer that converts and writes one block at a time
+    The header is written with placeholder sizes and patched on close(), so the length need not be known in advance.
+    :param filename: path of the WAV file
+    :param fs: sampling rate
+    :param channels: number of channels
+    :param dtype: sample format of the file, 'int16', 'int32', 'float32' or 'float64'
+    """
+
+    def __init__(self, filename, fs, channels=1, dtype='float32'):
+        if dtype not in ('int16', 'int32', 'float32', 'float64'):
+            raise ValueError('Unsupported WAV sample format %s.' % dtype)
+        self.filename = filename
+        self.fs = int(fs)
+        self.channels = channels
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.float = self.dtype.kind == 'f'
+        self.width = self.dtype.itemsize
+        self.length = 0
+        self.file = open(filename, 'wb')
+        tag = WAVE_FORMAT_IEEE_FLOAT if self.float else WAVE_FORMAT_PCM
+        block_align = self.channels * self.width
+        self.file.write(struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 0, b'WAVE', b'fmt ', 16, tag, self.channels,
+                                    self.fs, self.fs * block_align, block_align, 8 * self.width, b'data', 0))
+
+    def write(self, block):
+        """
+        Convert and append samples; integer formats are scaled by 2 ** (bits - 1) and clipped
+        :param block: 1-D array for mono files, (channels, samples) otherwise (the layout returned by WaveFile.read)
+        """
+        block = np.asarray(block)
+        block = block[:, None] if block.ndim == 1 else block.T
+        if block.shape[1] != self.channels:
+            raise ValueError('Expected %d channels, got %d.' % (self.channels, block.shape[1]))
+        if not self.float:
+            scale = 2 ** (8 * self.width - 1)
+            block = np.clip(np.round(block * scale), -scale, scale - 1)
+        self.file.write(np.ascontiguousarray(block, dtype=self.dtype).tobytes())
+        self.length += len(block)
+
+    def close(self):
+        if self.file.closed:
+            return
+        size = self.length * self.channels * self.width
+        if size % 2:
+            self.file.write(b'\0')  # Chunks are word aligned
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', 36 + size + size % 2))
+        self.file.seek(40)
+        self.file.write(struct.pack('<I', size))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def writeWave(filename, data, fs, dtype='float32', blocksize=65536):
+    """
+    Write a whole signal through WaveWriter, blocksize samples at a time (replaces the removed
+    librosa.output.write_wav)
+    :param filename: path of the WAV file
+    :param data: 1-D signal or (channels, samples)
+    :param fs: sampling rate
+    :param dtype: sample format of the file, see WaveWriter
+    :param blocksize: samples converted per block, bounds the temporary memory
+    """
+    data = np.asarray(data)
+    channels = 1 if data.ndim == 1 else data.shape[0]
+    with WaveWriter(filename, fs, channels, dtype) as f:
+        for start in range(0, data.shape[-1], blocksize):
+            f.write(data[..., start:start + blocksize])
+
+
+def loadWave(filename, dtype='float64'):
+    """
+    Load a whole file: memory-mapped PCM / float WAV path, librosa only for compressed or unknown formats
+    :param filename: audio file
+    :param dtype: 'float32' or 'float64'
+    :return (samples, sampling rate), samples in the librosa.load(sr=None, mono=False) layout
+    """
+    with Profiler.stage('decode'):
+        try:
+            wav = WaveFile(filename)
+        except (ValueError, struct.error):
+            import librosa
+            return librosa.load(filename, sr=None, mono=False, dtype=dtype)
+        return wav.read(dtype=dtype), wav.fs